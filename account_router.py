@@ -0,0 +1,116 @@
+import bisect
+import hashlib
+import logging
+import time
+from metrics import metrics
+from session_pool import SessionPoolError
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+def account_id(email):
+    """Стабильный идентификатор аккаунта, не раскрывающий email"""
+    return hashlib.sha256(email.strip().lower().encode("utf-8")).hexdigest()[:12]
+
+class AccountShard:
+    """Аккаунт ChatGPT со своим пулом сессий"""
+
+    def __init__(self, account_id, pool):
+        self.account_id = account_id
+        self.pool = pool
+        self.cooldown_until = 0.0
+
+    @property
+    def cooling_down(self):
+        return time.monotonic() < self.cooldown_until
+
+    @property
+    def available(self):
+        """Аккаунт принимает запросы: не на паузе и пул не сломан целиком"""
+        return not self.cooling_down and self.pool.readiness in ("ready", "warming_up")
+
+class AccountRouter:
+    """Распределение пользователей по аккаунтам ChatGPT.
+
+    Пользователь привязывается к аккаунту консистентным хешированием, поэтому
+    его разговор остается в одном аккаунте, а при добавлении аккаунта
+    переезжает лишь небольшая доля пользователей. Если аккаунт на паузе из-за
+    лимитов или все его сессии сломаны, запрос уходит следующему аккаунту на
+    кольце; после восстановления пользователи возвращаются обратно.
+    """
+
+    def __init__(self, shards, cooldown=3600, vnodes=100):
+        self.shards = shards
+        self.cooldown = cooldown
+        ring = sorted(
+            (_hash(f"{shard.account_id}#{vnode}"), index)
+            for index, shard in enumerate(shards) for vnode in range(vnodes)
+        )
+        self._keys = [key for key, _ in ring]
+        self._ring = [index for _, index in ring]
+        self.logger = logging.getLogger(__name__)
+
+    def route(self, user_id):
+        """Аккаунт для запроса пользователя"""
+        start = bisect.bisect(self._keys, _hash(str(user_id)))
+        tried = set()
+        for offset in range(len(self._ring)):
+            index = self._ring[(start + offset) % len(self._ring)]
+            if index in tried:
+                continue
+            shard = self.shards[index]
+            if shard.available:
+                if tried:
+                    metrics.inc("shard_rebalanced_total", help_text="Запросы, перенаправленные на другой аккаунт")
+                return shard
+            tried.add(index)
+            if len(tried) == len(self.shards):
+                break
+        raise SessionPoolError("Все аккаунты ChatGPT недоступны или достигли лимита сообщений. Попробуйте позже")
+
+    def cool_down(self, shard, seconds=None):
+        """Пауза аккаунта после сообщения о лимите"""
+        seconds = self.cooldown if seconds is None else seconds
+        shard.cooldown_until = time.monotonic() + seconds
+        metrics.inc("account_cooldowns_total", help_text="Паузы аккаунтов из-за лимитов ChatGPT")
+        self.logger.warning(f"Аккаунт {shard.account_id} на паузе {seconds} с из-за лимита сообщений")
+
+    @property
+    def cooling(self):
+        """Число аккаунтов на паузе"""
+        return sum(shard.cooling_down for shard in self.shards)
+
+    @property
+    def readiness(self):
+        """Лучшее состояние среди пулов аккаунтов"""
+        states = {shard.pool.readiness for shard in self.shards}
+        for state in ("ready", "warming_up", "unavailable"):
+            if state in states:
+                return state
+        return "stopped"
+
+    def start(self):
+        for shard in self.shards:
+            shard.pool.start()
+
+    def stats(self):
+        """Сводка состояний сессий всех аккаунтов"""
+        total = {}
+        for shard in self.shards:
+            for state, count in shard.pool.stats().items():
+                total[state] = total.get(state, 0) + count
+        return total
+
+    async def memory_usage(self):
+        """Память сессий; при нескольких аккаунтах ключи вида "аккаунт.сессия\""""
+        if len(self.shards) == 1:
+            return await self.shards[0].pool.memory_usage()
+        usage = {}
+        for number, shard in enumerate(self.shards):
+            for index, mb in (await shard.pool.memory_usage()).items():
+                usage[f"{number}.{index}"] = mb
+        return usage
+
+    async def close(self):
+        for shard in self.shards:
+            await shard.pool.close()
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from chatgpt_client import ChatGPTClient, RateLimitError, ResponseError, process_tree_rss_mb
+from metrics import metrics
+
+# Клиент рабочего процесса, когда сессия запущена с process=True
+_worker_client = None
+
+def _init_worker(client_kwargs):
+    """Создание ChatGPTClient в рабочем процессе"""
+    global _worker_client
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    _worker_client = ChatGPTClient(**client_kwargs)
+
+def _call_worker(name, *args):
+    """Вызов метода ChatGPTClient рабочего процесса"""
+    return getattr(_worker_client, name)(*args)
+
+class AsyncChatGPTClient:
+    """Асинхронная обертка над ChatGPTClient.
+
+    Все вызовы WebDriver выполняются в отдельном выделенном потоке, поэтому
+    event loop Telegram-бота не блокируется на время работы браузера. С
+    process=True клиент живет в отдельном рабочем процессе: падение или
+    зависание браузера не затрагивает процесс бота.
+    """
+
+    def __init__(self, process=False, **client_kwargs):
+        self.poll_interval = client_kwargs.get("poll_interval", 0.25)
+        self._driver_pid = None
+        if process:
+            self.client = None
+            # spawn: fork процесса с event loop и потоками небезопасен
+            self._executor = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(client_kwargs,)
+            )
+        else:
+            self.client = ChatGPTClient(**client_kwargs)
+            # Один поток на браузер: Selenium не потокобезопасен, а так все
+            # команды к WebDriver гарантированно выполняются последовательно
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chatgpt-browser")
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def driver(self):
+        return self.client.driver if self.client else None
+
+    async def _run(self, name, *args):
+        """Выполнение блокирующего метода ChatGPTClient в потоке или процессе браузера"""
+        loop = asyncio.get_running_loop()
+        if self.client is None:
+            return await loop.run_in_executor(self._executor, _call_worker, name, *args)
+        return await loop.run_in_executor(self._executor, getattr(self.client, name), *args)
+
+    async def setup_driver(self):
+        """Асинхронная настройка WebDriver"""
+        with metrics.timer("setup_driver_seconds", "Запуск браузера и WebDriver"):
+            result = await self._run("setup_driver")
+        self._driver_pid = await self._run("driver_pid")
+        return result
+
+    async def login(self):
+        """Асинхронный вход в ChatGPT"""
+        with metrics.timer("login_seconds", "Вход в ChatGPT"):
+            return await self._run("login")
+
+    async def send_message(self, message):
+        """Асинхронная отправка сообщения в ChatGPT"""
+        return await self._run("send_message", message)
+
+    async def get_response(self, message, conversation_url=None):
+        """Асинхронное получение ответа; ошибки пробрасываются вызывающему"""
+        response = ""
+        async for response in self.stream_message(message, conversation_url):
+            pass
+        if not response:
+            raise NoSuchElementException("Не удалось найти ответ")
+        return response
+
+    async def stream_message(self, message, conversation_url=None):
+        """Асинхронная отправка сообщения с постепенной выдачей ответа.
+
+        Генерирует текст ответа по мере его появления на странице; каждый
+        опрос страницы выполняется в потоке браузера.
+        """
+        with metrics.timer("input_seconds", "Переход в разговор и ввод запроса"):
+            await self._run("submit_message", message, conversation_url)
+        submitted_at = time.monotonic()
+        last_text = None
+        try:
+            while True:
+                poll_started = time.monotonic()
+                try:
+                    text, done = await self._run("poll_response")
+                except TimeoutException:
+                    metrics.inc("timeouts_total", help_text="Таймауты генерации ответа")
+                    raise
+                if text and last_text is None:
+                    metrics.observe("time_to_first_token_seconds", time.monotonic() - submitted_at,
+                                    "Время от отправки запроса до первого текста ответа")
+                if done:
+                    metrics.observe("generation_seconds", time.monotonic() - submitted_at,
+                                    "Время от отправки запроса до завершения генерации")
+                    metrics.observe("extraction_seconds", time.monotonic() - poll_started,
+                                    "Чтение готового ответа со страницы")
+                if text and text != last_text:
+                    last_text = text
+                    yield text
+                if done:
+                    return
+                await asyncio.sleep(self.poll_interval)
+        except RateLimitError:
+            # Лимит распознан до появления ответа: запрос можно повторить в другом аккаунте
+            raise
+        except Exception as e:
+            raise ResponseError(f"Запрос отправлен, но ответ не получен: {e}") from e
+
+    async def last_response_html(self):
+        """Последний ответ в HTML-разметке Telegram"""
+        return await self._run("last_response_html")
+
+    async def conversation_url(self):
+        """URL текущего разговора на странице"""
+        return await self._run("current_conversation_url")
+
+    async def probe_health(self):
+        """Асинхронная подробная проверка сессии"""
+        return await self._run("probe_health")
+
+    async def refresh_session(self):
+        """Асинхронное продление сессии"""
+        return await self._run("refresh_session")
+
+    async def memory_usage(self):
+        """RSS процессов браузера (МБ); читается из /proc, не занимая поток браузера"""
+        return await asyncio.to_thread(process_tree_rss_mb, self._driver_pid)
+
+    async def check_health(self):
+        """Асинхронная проверка работоспособности сессии"""
+        return await self._run("check_health")
+
+    async def export_history(self, filename="chat_history.txt"):
+        """Асинхронный экспорт истории чата"""
+        return await self._run("export_history", filename)
+
+    async def close(self):
+        """Закрытие браузера и остановка рабочего потока или процесса"""
+        try:
+            await self._run("close")
+        finally:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Офлайн-бенчмарк ChatGPTClient на локальной заглушке веб-интерфейса ChatGPT.
+
+Поднимает HTTP-сервер с mock_chatgpt.html, направляет на него пул сессий
+через base_url и измеряет пропускную способность, задержки p50/p95, время до
+первого текста ответа и память браузеров для разных размеров запроса, длины
+ответа и числа параллельных сессий.
+
+Пример:
+    python benchmark/run_benchmark.py --concurrency 1,2 --prompt-sizes 100,2000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_client import AsyncChatGPTClient
+from cdp_client import CDPChatGPTClient
+from session_pool import SessionPool
+
+MOCK_PAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_chatgpt.html")
+
+logger = logging.getLogger("benchmark")
+
+class MockChatGPTServer:
+    """HTTP-сервер заглушки; параметры генерации можно менять между сценариями"""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        with open(MOCK_PAGE_PATH, "r", encoding="utf-8") as f:
+            self.template = f.read()
+        self.config = {"tokens": 200, "token_delay_ms": 20}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/favicon"):
+                    self.send_error(404)
+                    return
+                body = server.template.replace(
+                    '/*MOCK_CONFIG*/{"tokens": 200, "token_delay_ms": 20}', json.dumps(server.config)
+                ).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logger.info(f"Заглушка ChatGPT: {self.url}")
+
+    def stop(self):
+        self.httpd.shutdown()
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)] if values else 0.0
+
+async def timed_request(pool, prompt):
+    """Один запрос через пул: полная задержка и время до первого текста"""
+    started = time.monotonic()
+    first_token = None
+    response = ""
+    async with pool.session() as client:
+        async for response in client.stream_message(prompt):
+            if first_token is None:
+                first_token = time.monotonic() - started
+    return time.monotonic() - started, first_token or 0.0, len(response)
+
+async def run_scenario(pool, server, prompt_size, tokens, requests):
+    server.config["tokens"] = tokens
+    prompt = ("benchmark prompt " * (prompt_size // 17 + 1))[:prompt_size]
+    started = time.monotonic()
+    results = await asyncio.gather(*(timed_request(pool, prompt) for _ in range(requests)))
+    wall = time.monotonic() - started
+    latencies = [r[0] for r in results]
+    ttft = [r[1] for r in results]
+    memory = await pool.memory_usage()
+    return {
+        "prompt_chars": prompt_size,
+        "response_tokens": tokens,
+        "sessions": pool.size,
+        "requests": requests,
+        "throughput_rps": requests / wall,
+        "latency_p50": statistics.median(latencies),
+        "latency_p95": percentile(latencies, 0.95),
+        "ttft_p50": statistics.median(ttft),
+        "response_chars": statistics.median(r[2] for r in results),
+        "memory_mb": sum(memory.values()),
+    }
+
+async def run(args):
+    server = MockChatGPTServer()
+    server.config["token_delay_ms"] = args.token_delay_ms
+    server.start()
+    results = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        for sessions in args.concurrency:
+            def create_client(index):
+                client_kwargs = dict(
+                    email="bench@example.com",
+                    password="bench",
+                    headless=not args.show_browser,
+                    base_url=server.url,
+                    input_mode=args.input_mode,
+                    lean_mode=args.lean,
+                    cookie_path=os.path.join(data_dir, f"cookies_{index}.json"),
+                    discovery_cache_path=os.path.join(data_dir, "driver_cache.json")
+                )
+                if args.backend == "cdp":
+                    return CDPChatGPTClient(**client_kwargs)
+                return AsyncChatGPTClient(process=args.processes, **client_kwargs)
+            pool = SessionPool(create_client, size=sessions, health_check_interval=0)
+            pool.start()
+            try:
+                # Прогрев: первая сессия готова - можно мерить
+                async with pool.session():
+                    pass
+                for prompt_size in args.prompt_sizes:
+                    for tokens in args.response_tokens:
+                        result = await run_scenario(pool, server, prompt_size, tokens, args.requests)
+                        results.append(result)
+                        print_result(result)
+            finally:
+                await pool.close()
+    server.stop()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+def print_result(r):
+    print(
+        f"sessions={r['sessions']:<2} prompt={r['prompt_chars']:<6} tokens={r['response_tokens']:<5} "
+        f"rps={r['throughput_rps']:.2f}  p50={r['latency_p50']:.2f}s  p95={r['latency_p95']:.2f}s  "
+        f"ttft={r['ttft_p50']:.2f}s  mem={r['memory_mb']:.0f}MB",
+        flush=True
+    )
+
+def int_list(value):
+    return [int(x) for x in value.split(",") if x.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк ChatGPTClient на локальной заглушке")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 2], help="Размеры пула сессий")
+    parser.add_argument("--prompt-sizes", type=int_list, default=[100, 2000], help="Длины запроса (символы)")
+    parser.add_argument("--response-tokens", type=int_list, default=[50, 500], help="Длины ответа (слова)")
+    parser.add_argument("--requests", type=int, default=8, help="Запросов на сценарий")
+    parser.add_argument("--token-delay-ms", type=int, default=20, help="Задержка между словами ответа")
+    parser.add_argument("--input-mode", default="insert", choices=["insert", "js", "typing"])
+    parser.add_argument("--lean", action="store_true", help="Экономный режим браузера")
+    parser.add_argument("--backend", default="selenium", choices=["selenium", "cdp"], help="Управление браузером")
+    parser.add_argument("--processes", action="store_true", help="Каждая сессия в отдельном рабочем процессе")
+    parser.add_argument("--show-browser", action="store_true", help="Запуск браузера с окном")
+    parser.add_argument("--json", help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
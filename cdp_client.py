@@ -0,0 +1,619 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+import websockets
+from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from chatgpt_client import (
+    BrowserSession, CHATGPT_URL, CHROMIUM_ARGS, USER_AGENT, HIDE_WEBDRIVER_JS, LEAN_CHROMIUM_ARGS,
+    LEAN_BLOCKED_URLS, RESPONSE_STATE_JS, LIMIT_ALERT_JS, HEALTH_JS, TURN_SELECTOR, SESSION_COOKIE, INPUT_MODES,
+    RateLimitError, ResponseError, cookie_params, failure_reply, health_report, process_tree_rss_mb, url_origin
+)
+from metrics import metrics
+
+# Имя функции, через которую страница сообщает об изменениях DOM
+NOTIFY_BINDING = "__gptNotify"
+
+# Наблюдатель за DOM в каждом новом документе: изменения сообщаются клиенту
+# событием Runtime.bindingCalled (не чаще раза в 50 мс) вместо опроса страницы
+DOM_OBSERVER_JS = """
+(() => {
+    let scheduled = false;
+    window.__gptLastMutation = Date.now();
+    const notify = () => {
+        scheduled = false;
+        if (window.%(binding)s) window.%(binding)s('');
+    };
+    window.__gptObserver = new MutationObserver(() => {
+        window.__gptLastMutation = Date.now();
+        if (!scheduled) {
+            scheduled = true;
+            setTimeout(notify, 50);
+        }
+    });
+    window.__gptObserver.observe(document, {childList: true, subtree: true, characterData: true});
+})();
+""" % {"binding": NOTIFY_BINDING}
+
+# Фокус на поле ввода и его очистка (или установка значения в режиме js)
+PREPARE_INPUT_JS = """
+const element = document.querySelector('textarea');
+if (!element) return false;
+element.focus();
+const text = arguments[0] === null ? '' : arguments[0];
+if (element.isContentEditable) {
+    document.execCommand('selectAll', false, null);
+    document.execCommand('insertText', false, text);
+} else {
+    const setter = Object.getOwnPropertyDescriptor(Object.getPrototypeOf(element), 'value').set;
+    setter.call(element, text);
+}
+element.dispatchEvent(new Event('input', {bubbles: true}));
+return true;
+"""
+
+# Видимое поле формы входа с фокусом на нем
+FOCUS_FIELD_JS = """
+const element = document.querySelector(arguments[0]);
+if (!element || element.hidden || element.offsetParent === null) return false;
+element.focus();
+element.value = '';
+return true;
+"""
+
+CLICK_LOGIN_JS = """
+const button = Array.from(document.querySelectorAll('button')).find(b => b.textContent.includes('Log in'));
+if (!button || button.disabled) return false;
+button.click();
+return true;
+"""
+
+ENTER_KEY = {"key": "Enter", "code": "Enter", "windowsVirtualKeyCode": 13, "nativeVirtualKeyCode": 13}
+
+class CDPError(Exception):
+    """Ошибка, возвращенная Chrome DevTools Protocol"""
+
+class CDPConnection:
+    """Соединение с браузером по DevTools Protocol через websocket.
+
+    Команды отправляются асинхронно и сопоставляются с ответами по id;
+    события рассылаются подписчикам.
+    """
+
+    def __init__(self):
+        self.ws = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._listeners = {}
+        self._reader = None
+        self.logger = logging.getLogger(__name__)
+
+    async def connect(self, url):
+        self.ws = await websockets.connect(url, max_size=None, ping_interval=None)
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for raw in self.ws:
+                message = json.loads(raw)
+                if "id" in message:
+                    future = self._pending.pop(message["id"], None)
+                    if future is None or future.done():
+                        continue
+                    if "error" in message:
+                        future.set_exception(CDPError(message["error"].get("message", message["error"])))
+                    else:
+                        future.set_result(message.get("result", {}))
+                else:
+                    for callback in list(self._listeners.get(message.get("method"), ())):
+                        callback(message.get("params", {}), message.get("sessionId"))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            # Браузер закрылся: ожидающие команды не получат ответа
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(CDPError("Соединение с браузером закрыто"))
+            self._pending.clear()
+
+    async def send(self, method, params=None, session_id=None, timeout=60):
+        """Команда DevTools и ее результат"""
+        if self._reader is None or self._reader.done():
+            raise CDPError("Соединение с браузером закрыто")
+        command_id = next(self._ids)
+        message = {"id": command_id, "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[command_id] = future
+        await self.ws.send(json.dumps(message))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(command_id, None)
+
+    def on(self, event, callback):
+        """Подписка на событие DevTools"""
+        self._listeners.setdefault(event, []).append(callback)
+
+    def off(self, event, callback):
+        listeners = self._listeners.get(event, [])
+        if callback in listeners:
+            listeners.remove(callback)
+
+    async def close(self):
+        if self.ws:
+            await self.ws.close()
+        if self._reader:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+class CDPChatGPTClient:
+    """Асинхронный клиент ChatGPT, управляющий Chromium напрямую по DevTools Protocol.
+
+    В отличие от ChatGPTClient не использует chromedriver: команды идут по
+    одному websocket без HTTP-запроса на каждое действие, а ожидание ответа
+    построено на событиях об изменениях DOM вместо периодического опроса.
+    Интерфейс совпадает с AsyncChatGPTClient, поэтому клиент подходит для
+    SessionPool без изменений.
+    """
+
+    def __init__(self, email, password, headless=False, timeout=30, cookie_path="cookies.json",
+                 discovery_cache_path="driver_cache.json", response_timeout=180, response_stable_seconds=1.0,
+                 poll_interval=0.25, input_mode="insert", history_size=100, profile_dir=None,
+                 lean_mode=False, reload_every=0, base_url=CHATGPT_URL):
+        if input_mode not in INPUT_MODES:
+            raise ValueError(f"Неизвестный способ ввода: {input_mode}. Допустимые: {', '.join(INPUT_MODES)}")
+        # Поиск Chromium, профиль, файл сессии, правило завершения ответа и история - общие с ChatGPTClient
+        self.session = BrowserSession(
+            cookie_path=cookie_path, discovery_cache_path=discovery_cache_path, profile_dir=profile_dir,
+            base_url=base_url, history_size=history_size, response_timeout=response_timeout,
+            response_stable_seconds=response_stable_seconds, reload_every=reload_every
+        )
+        self.email = email
+        self.password = password
+        self.headless = headless
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.input_mode = input_mode
+        self.lean_mode = lean_mode
+        self.process = None
+        self.cdp = None
+        self.session_id = None
+        self._temp_dir = None
+        self._restore_script_id = None
+        self._changed = asyncio.Event()
+        self.logger = logging.getLogger(__name__)
+
+    async def setup_driver(self):
+        """Запуск Chromium с DevTools и подключение к его вкладке"""
+        with metrics.timer("setup_driver_seconds", "Запуск браузера и WebDriver"):
+            chromium_path = await asyncio.to_thread(self.session.cached_binary, "chromium", self.session.find_chromium)
+            if not chromium_path:
+                raise Exception("Chromium не найден. Установите Chromium: sudo apt install chromium-browser")
+            # Процесс Chromium без chromedriver не сообщает причину сбоя запуска;
+            # поврежденный профиль распознается по настройкам в BrowserSession.prepare_profile
+            try:
+                await self._launch(chromium_path)
+            except Exception:
+                await self._terminate()
+                raise
+            await self._attach()
+
+    async def _launch(self, chromium_path):
+        """Запуск процесса Chromium и подключение к DevTools"""
+        # Работа с файлами профиля и сессии идет в потоке, как у Selenium-клиента:
+        # event loop бота обслуживает остальные чаты
+        if self.session.profile_dir:
+            await asyncio.to_thread(self.session.prepare_profile)
+            user_data_dir = self.session.profile_dir
+        else:
+            self._temp_dir = self._temp_dir or tempfile.mkdtemp(prefix="chatgpt-cdp-")
+            user_data_dir = self._temp_dir
+        port_file = os.path.join(user_data_dir, "DevToolsActivePort")
+        if os.path.exists(port_file):
+            os.remove(port_file)
+
+        args = list(CHROMIUM_ARGS) + [
+            f"--user-agent={USER_AGENT}",
+            f"--user-data-dir={user_data_dir}",
+            "--remote-debugging-port=0",
+            "--no-first-run",
+            "--no-default-browser-check",
+        ]
+        if self.headless:
+            args.append("--headless=new")
+        if self.lean_mode:
+            args.extend(LEAN_CHROMIUM_ARGS)
+        self.process = await asyncio.create_subprocess_exec(
+            chromium_path, *args, "about:blank",
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+
+        # С портом 0 Chromium сам выбирает порт и записывает его в DevToolsActivePort
+        deadline = time.monotonic() + self.timeout
+        while not os.path.exists(port_file):
+            if self.process.returncode is not None:
+                raise Exception(f"Chromium завершился при запуске с кодом {self.process.returncode}")
+            if time.monotonic() > deadline:
+                raise Exception("Chromium не открыл порт DevTools")
+            await asyncio.sleep(0.05)
+        with open(port_file, "r", encoding="utf-8") as f:
+            port, path = f.read().split()[:2]
+        self.cdp = CDPConnection()
+        await self.cdp.connect(f"ws://127.0.0.1:{port}{path}")
+        self.logger.info("Chromium запущен, DevTools подключен")
+
+    async def _attach(self):
+        """Подключение к вкладке и подписка на события страницы"""
+        targets = (await self.cdp.send("Target.getTargets"))["targetInfos"]
+        page = next((t for t in targets if t["type"] == "page"), None)
+        if page:
+            target_id = page["targetId"]
+        else:
+            target_id = (await self.cdp.send("Target.createTarget", {"url": "about:blank"}))["targetId"]
+        result = await self.cdp.send("Target.attachToTarget", {"targetId": target_id, "flatten": True})
+        self.session_id = result["sessionId"]
+
+        self.cdp.on("Runtime.bindingCalled", self._on_page_event)
+        self.cdp.on("Page.frameNavigated", self._on_page_event)
+        self.cdp.on("Page.domContentEventFired", self._on_page_event)
+        await asyncio.gather(
+            self._send("Page.enable"),
+            self._send("Runtime.enable"),
+            self._send("Runtime.addBinding", {"name": NOTIFY_BINDING}),
+            self._send("Page.addScriptToEvaluateOnNewDocument", {"source": HIDE_WEBDRIVER_JS}),
+            self._send("Page.addScriptToEvaluateOnNewDocument", {"source": DOM_OBSERVER_JS}),
+            self._send("Network.enable"),
+        )
+        # Экономный режим: запросы к ненужным ресурсам отбрасываются самим браузером
+        if self.lean_mode:
+            await self._send("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+
+    def _on_page_event(self, params, session_id):
+        if session_id == self.session_id:
+            self._changed.set()
+
+    async def _send(self, method, params=None):
+        """Команда DevTools для вкладки ChatGPT"""
+        return await self.cdp.send(method, params, session_id=self.session_id)
+
+    async def _evaluate(self, script, *args):
+        """Выполнение тела JS-функции (как execute_script) одной командой Runtime.evaluate"""
+        expression = f"(function() {{\n{script}\n}}).apply(null, {json.dumps(args)})"
+        result = await self._send("Runtime.evaluate", {"expression": expression, "returnByValue": True})
+        if "exceptionDetails" in result:
+            details = result["exceptionDetails"]
+            raise CDPError(details.get("exception", {}).get("description") or details.get("text"))
+        return result["result"].get("value")
+
+    async def _wait_change(self, timeout):
+        """Ожидание изменения DOM или навигации, не дольше timeout"""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._changed.clear()
+
+    async def _wait_for(self, script, *args, timeout=None):
+        """Ожидание истинного результата script; проверка повторяется по событиям страницы"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        while True:
+            self._changed.clear()
+            try:
+                value = await self._evaluate(script, *args)
+                if value:
+                    return value
+            except CDPError:
+                # Контекст страницы сменился во время навигации
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutException("Не дождались нужного состояния страницы")
+            # Страховочная перепроверка раз в секунду на случай пропущенного события
+            await self._wait_change(min(remaining, 1.0))
+
+    async def _navigate(self, url):
+        """Переход по адресу с ожиданием загрузки нового документа"""
+        loaded = asyncio.get_running_loop().create_future()
+
+        def on_loaded(params, session_id):
+            if session_id == self.session_id and not loaded.done():
+                loaded.set_result(True)
+
+        self.cdp.on("Page.domContentEventFired", on_loaded)
+        try:
+            result = await self._send("Page.navigate", {"url": url})
+            if result.get("errorText"):
+                raise CDPError(f"Не удалось открыть {url}: {result['errorText']}")
+            await asyncio.wait_for(loaded, self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutException(f"Страница {url} не загрузилась")
+        finally:
+            self.cdp.off("Page.domContentEventFired", on_loaded)
+
+    async def _press_enter(self):
+        await self._send("Input.dispatchKeyEvent", dict(ENTER_KEY, type="keyDown", text="\r"))
+        await self._send("Input.dispatchKeyEvent", dict(ENTER_KEY, type="keyUp"))
+
+    async def _type_slowly(self, text, min_delay=0.07, max_delay=0.18):
+        """Посимвольный ввод для эмуляции пользователя"""
+        for char in text:
+            await self._send("Input.insertText", {"text": char})
+            await asyncio.sleep(random.uniform(min_delay, max_delay))
+
+    async def save_cookies(self):
+        """Сохранение cookies и localStorage в JSON"""
+        try:
+            cookies = (await self._send("Network.getAllCookies"))["cookies"]
+            local_storage = await self._evaluate("return Object.assign({}, window.localStorage)")
+            origin = url_origin(await self._current_url())
+            await asyncio.to_thread(self.session.write_state, cookies, local_storage, origin)
+        except Exception as e:
+            self.logger.warning(f"Ошибка при сохранении cookies: {e}")
+
+    async def load_cookies(self):
+        """Восстановление cookies и localStorage до первой загрузки страницы"""
+        state = await asyncio.to_thread(self.session.load_state)
+        if not state:
+            return False
+        try:
+            await self._send("Network.setCookies", {"cookies": cookie_params(state["cookies"])})
+            # localStorage восстанавливается для origin, на котором был сохранен
+            restore_script = self.session.restore_script(state)
+            if restore_script:
+                if self._restore_script_id:
+                    await self._send("Page.removeScriptToEvaluateOnNewDocument", {"identifier": self._restore_script_id})
+                result = await self._send("Page.addScriptToEvaluateOnNewDocument", {"source": restore_script})
+                self._restore_script_id = result.get("identifier")
+            self.logger.info("Cookies загружены")
+            return True
+        except Exception as e:
+            self.logger.warning(f"Ошибка при загрузке cookies: {e}")
+            return False
+
+    async def login(self):
+        """Вход в ChatGPT"""
+        with metrics.timer("login_seconds", "Вход в ChatGPT"):
+            try:
+                # Cookies установлены до загрузки страницы: теплый вход - одна загрузка
+                if await self.load_cookies():
+                    self.logger.info("Открываем ChatGPT...")
+                    await self._navigate(self.session.base_url)
+                    try:
+                        await self._wait_for(
+                            "return !!document.querySelector('textarea') || location.pathname.startsWith('/auth')"
+                        )
+                        if await self.check_health():
+                            self.session.remember_home(await self._current_url())
+                            self.logger.info("✅ Вход через сохраненные cookies")
+                            return True
+                    except TimeoutException:
+                        pass
+                    self.logger.info("⚠️ Cookies устарели, пробуем войти вручную...")
+
+                # Ручной вход
+                await self._navigate(f"{self.session.base_url}/auth/login")
+                await self._wait_for(CLICK_LOGIN_JS)
+                await asyncio.sleep(random.uniform(1.0, 2.0))
+
+                self.logger.info("Вводим email...")
+                await self._wait_for(FOCUS_FIELD_JS, "[name=username]")
+                await self._type_slowly(self.email)
+                await asyncio.sleep(random.uniform(0.5, 1.0))
+                await self._press_enter()
+                await asyncio.sleep(random.uniform(1.0, 2.0))
+
+                self.logger.info("Вводим пароль...")
+                await self._wait_for(FOCUS_FIELD_JS, "[name=password]")
+                await self._type_slowly(self.password)
+                await asyncio.sleep(random.uniform(0.5, 1.0))
+                await self._press_enter()
+
+                self.logger.info("Ожидаем загрузки чата...")
+                await self._wait_for("return !!document.querySelector('textarea')")
+                self.session.remember_home(await self._current_url())
+                self.logger.info("✅ Успешный вход в ChatGPT")
+                await self.save_cookies()
+                return True
+
+            except TimeoutException as e:
+                self.logger.error(f"Таймаут при входе: {e}")
+                return False
+            except Exception as e:
+                self.logger.error(f"Ошибка при входе: {e}")
+                return False
+
+    async def _current_url(self):
+        return await self._evaluate("return location.href")
+
+    async def _response_state(self, include_text=False):
+        return await self._evaluate(RESPONSE_STATE_JS, TURN_SELECTOR, include_text)
+
+    async def _open_conversation(self, conversation_url=None):
+        """Прямой переход в разговор по URL; без URL - в новый разговор"""
+        target, on_home = self.session.navigation_target(await self._current_url(), conversation_url)
+        # Пустая страница нового разговора уже открыта
+        if not target or (on_home and (await self._response_state())["turn"] == 0):
+            return
+        self.logger.info(f"Переходим в разговор: {target}")
+        await self._navigate(target)
+        await self._wait_for("return !!document.querySelector('textarea')")
+        self.session.page_loaded(await self._current_url(), conversation_url)
+
+    async def _submit(self, message, conversation_url=None):
+        """Ввод сообщения и запуск генерации; возвращает номер последнего хода до отправки"""
+        await self._open_conversation(conversation_url)
+        initial_turn = (await self._response_state())["turn"]
+        await self._wait_for(PREPARE_INPUT_JS, message if self.input_mode == "js" else None)
+        if self.input_mode == "typing":
+            await self._type_slowly(message)
+            await asyncio.sleep(random.uniform(0.2, 0.5))
+        elif self.input_mode == "insert":
+            await self._send("Input.insertText", {"text": message})
+        await self._press_enter()
+        self.session.start_response(message, initial_turn)
+        self.logger.info("Ожидаем ответ от ChatGPT...")
+        return initial_turn
+
+    async def stream_message(self, message, conversation_url=None):
+        """Отправка сообщения с постепенной выдачей ответа.
+
+        Состояние ответа читается одной командой Runtime.evaluate при каждом
+        изменении DOM, но не чаще poll_interval. Когда страница затихает, клиент
+        ждет окно стабильности и проверяет завершение (см. BrowserSession.track).
+        """
+        with metrics.timer("input_seconds", "Переход в разговор и ввод запроса"):
+            await self._submit(message, conversation_url)
+        submitted_at = time.monotonic()
+        last_text = None
+        try:
+            while True:
+                poll_started = time.monotonic()
+                self._changed.clear()
+                state = await self._response_state(include_text=True)
+                text, done = self.session.track(state)
+                if text and last_text is None:
+                    metrics.observe("time_to_first_token_seconds", time.monotonic() - submitted_at,
+                                    "Время от отправки запроса до первого текста ответа")
+                if done:
+                    metrics.observe("generation_seconds", time.monotonic() - submitted_at,
+                                    "Время от отправки запроса до завершения генерации")
+                    metrics.observe("extraction_seconds", time.monotonic() - poll_started,
+                                    "Чтение готового ответа со страницы")
+                if text and text != last_text:
+                    last_text = text
+                    yield text
+                if done:
+                    return
+                if self.session.expired:
+                    metrics.inc("timeouts_total", help_text="Таймауты генерации ответа")
+                    raise self.session.timeout_error(await self._limit_alert())
+                # Без изменений DOM ждем до конца окна стабильности, чтобы проверить завершение
+                stable_left = self.session.response_stable_seconds - state["idle_ms"] / 1000
+                await self._wait_change(max(stable_left, self.poll_interval))
+                await asyncio.sleep(max(0.0, self.poll_interval - (time.monotonic() - poll_started)))
+        except RateLimitError:
+            # Лимит распознан до появления ответа: запрос можно повторить в другом аккаунте
+            raise
+        except Exception as e:
+            raise ResponseError(f"Запрос отправлен, но ответ не получен: {e}") from e
+
+    async def get_response(self, message, conversation_url=None):
+        """Получение ответа целиком; ошибки пробрасываются вызывающему"""
+        response = ""
+        async for response in self.stream_message(message, conversation_url):
+            pass
+        if not response:
+            raise NoSuchElementException("Не удалось найти ответ")
+        return response
+
+    async def send_message(self, message):
+        """Отправка сообщения в ChatGPT и получение ответа"""
+        try:
+            return await self.get_response(message)
+        except Exception as e:
+            return failure_reply(e, self.logger)
+
+    async def last_response_html(self):
+        """Последний ответ в HTML-разметке Telegram"""
+        return self.session.last_html
+
+    async def conversation_url(self):
+        """URL текущего разговора (/c/<id>) или None для нового разговора"""
+        url = await self._current_url()
+        return url if "/c/" in url else None
+
+    async def probe_health(self):
+        """Подробная проверка сессии: страница жива, вход выполнен, память, срок cookies"""
+        if not self.session_id:
+            return health_report()
+        try:
+            page, cookies = await asyncio.gather(
+                self._evaluate(HEALTH_JS.strip()),
+                self._send("Network.getCookies", {"urls": [self.session.home_url]})
+            )
+        except Exception as e:
+            self.logger.warning(f"Сессия не отвечает: {e}")
+            return health_report()
+        cookie = next((c for c in cookies["cookies"] if c["name"] == SESSION_COOKIE), None)
+        # Сессионные cookies (expires = -1) не имеют срока
+        return health_report(page, cookie["expires"] if cookie and cookie.get("expires", -1) > 0 else None)
+
+    async def check_health(self):
+        """Быстрая проверка работоспособности сессии"""
+        if not self.session_id:
+            return False
+        try:
+            return bool(await self._evaluate("return !!document.querySelector('textarea')"))
+        except Exception as e:
+            self.logger.warning(f"Сессия не отвечает: {e}")
+            return False
+
+    async def refresh_session(self):
+        """Продление сессии до истечения cookies; при неудаче - полный вход"""
+        try:
+            await self._navigate(self.session.base_url)
+            await self._wait_for("return !!document.querySelector('textarea')")
+            self.session.remember_home(await self._current_url())
+            await self.save_cookies()
+            self.logger.info("Сессия продлена")
+            return True
+        except Exception as e:
+            self.logger.warning(f"Не удалось продлить сессию, выполняем вход заново: {e}")
+            return await self.login()
+
+    async def memory_usage(self):
+        """RSS всех процессов браузера (МБ); читается из /proc"""
+        if not self.process:
+            return None
+        return await asyncio.to_thread(process_tree_rss_mb, self.process.pid)
+
+    async def _limit_alert(self):
+        """Текст баннеров интерфейса (LIMIT_ALERT_JS) или None"""
+        try:
+            return await self._evaluate(LIMIT_ALERT_JS, TURN_SELECTOR)
+        except Exception:
+            return None
+
+    async def export_history(self, filename="chat_history.txt"):
+        """Экспорт истории чата"""
+        await asyncio.to_thread(self.session.export_history, filename)
+
+    async def _terminate(self):
+        """Остановка процесса Chromium и закрытие соединения"""
+        closing = False
+        if self.cdp:
+            try:
+                await self.cdp.send("Browser.close", timeout=5)
+                closing = True
+            except Exception:
+                pass
+            await self.cdp.close()
+            self.cdp = None
+        if self.process and self.process.returncode is None:
+            # DevTools не подключен или не ответил: Browser.close не отправлен
+            if not closing:
+                try:
+                    self.process.terminate()
+                except ProcessLookupError:
+                    pass
+            try:
+                await asyncio.wait_for(self.process.wait(), 10)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        self.process = None
+        self.session_id = None
+
+    async def close(self):
+        """Закрытие браузера"""
+        await self._terminate()
+        if self._temp_dir:
+            await asyncio.to_thread(shutil.rmtree, self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+        self.logger.info("Браузер закрыт")
@@ -1,11 +1,16 @@
 import time
 import logging
 import random
-import pickle
 import os
 import subprocess
 import shutil
+import socket
+import json
+import re
+import threading
+from collections import deque
 from pathlib import Path
+from urllib.parse import urlsplit
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
@@ -16,19 +21,345 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from webdriver_manager.chrome import ChromeDriverManager
 
-class ChatGPTClient:
-    def __init__(self, email, password, headless=False, timeout=30, cookie_path="cookies.pkl"):
-        self.email = email
-        self.password = password
-        self.headless = headless
-        self.timeout = timeout
-        self.driver = None
-        self.wait = None
+CHATGPT_URL = "https://chat.openai.com"
+TURN_SELECTOR = "[data-testid^='conversation-turn']"
+
+# Текст баннеров ошибок интерфейса и последнего хода ассистента без ответа
+# (.markdown) - так ChatGPT показывает лимит сообщений. Текст ответов не
+# учитывается: ответ со словами "rate limit" не должен считаться лимитом
+UI_ALERT_JS = r"""
+function uiAlertText(turnSelector) {
+    const texts = [];
+    for (const element of document.querySelectorAll(
+        "[role='alert'], [data-testid*='error'], .text-token-text-error"
+    )) {
+        if (!element.closest('.markdown')) texts.push(element.innerText);
+    }
+    const first = document.querySelector(turnSelector);
+    const last = first ? first.parentElement.lastElementChild : null;
+    if (last && last.matches(turnSelector) && !last.querySelector('.markdown')
+            && last.querySelector("[data-message-author-role='assistant']")) {
+        texts.push(last.innerText);
+    }
+    return texts.join('\n').trim() || null;
+}
+"""
+LIMIT_ALERT_JS = UI_ALERT_JS + "return uiAlertText(arguments[0]);"
+
+# Преобразование DOM ответа в HTML-разметку, которую понимает Telegram:
+# жирный/курсив/код/ссылки сохраняются, списки и заголовки становятся текстом
+ANSWER_HTML_JS = r"""
+function escapeHtml(s) {
+    return s.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+}
+function render(node, ctx) {
+    if (node.nodeType === 3) return escapeHtml(node.textContent);
+    if (node.nodeType !== 1) return '';
+    const tag = node.tagName.toLowerCase();
+    const inner = () => Array.from(node.childNodes).map(n => render(n, ctx)).join('');
+    switch (tag) {
+        case 'pre': {
+            const code = node.querySelector('code');
+            const lang = code && /language-([\w+#-]+)/.exec(code.className);
+            const body = escapeHtml((code || node).textContent);
+            return '\n' + (lang ? '<pre><code class="language-' + lang[1] + '">' + body + '</code></pre>'
+                                : '<pre>' + body + '</pre>') + '\n';
+        }
+        case 'code': return '<code>' + escapeHtml(node.textContent) + '</code>';
+        case 'strong': case 'b': return '<b>' + inner() + '</b>';
+        case 'em': case 'i': return '<i>' + inner() + '</i>';
+        case 's': case 'del': return '<s>' + inner() + '</s>';
+        case 'u': return '<u>' + inner() + '</u>';
+        case 'a': {
+            const href = node.getAttribute('href');
+            if (!href || !/^https?:/.test(node.href)) return inner();
+            return '<a href="' + escapeHtml(node.href).replace(/"/g, '&quot;') + '">' + inner() + '</a>';
+        }
+        case 'h1': case 'h2': case 'h3': case 'h4': case 'h5': case 'h6':
+            return '\n<b>' + inner().trim() + '</b>\n';
+        case 'p': return inner() + '\n\n';
+        case 'br': return '\n';
+        case 'hr': return '\n———\n';
+        case 'blockquote': return '<blockquote>' + inner().trim() + '</blockquote>\n';
+        case 'ul': case 'ol': {
+            const depth = ctx.depth++;
+            const start = tag === 'ol' ? (node.start || 1) : 0;
+            const lines = Array.from(node.children).filter(c => c.tagName === 'LI').map((li, i) =>
+                '  '.repeat(depth) + (tag === 'ol' ? (start + i) + '. ' : '• ')
+                + render(li, ctx).trim().replace(/\n{2,}/g, '\n'));
+            ctx.depth--;
+            return (depth ? '\n' : '') + lines.join('\n') + (depth ? '' : '\n\n');
+        }
+        case 'table': {
+            const rows = Array.from(node.rows).map(r =>
+                Array.from(r.cells).map(c => escapeHtml(c.innerText.trim())).join(' | '));
+            return '<pre>' + rows.join('\n') + '</pre>\n';
+        }
+        case 'button': case 'svg': case 'style': case 'script': return '';
+        default: return inner();
+    }
+}
+function answerHtml(el) {
+    return render(el, {depth: 0}).replace(/\n{3,}/g, '\n\n').trim();
+}
+"""
+
+# Состояние генерации ответа за один вызов execute_script. Читается только
+# последний ход разговора: от конца списка ходов к началу до первого ответа,
+# без обхода всей переписки. MutationObserver запоминает время последнего
+# изменения DOM, кнопка "Stop" показывает, что ChatGPT еще генерирует ответ.
+RESPONSE_STATE_JS = ANSWER_HTML_JS + UI_ALERT_JS + """
+const root = document.querySelector('main') || document.body;
+if (!window.__gptObserver) {
+    window.__gptLastMutation = Date.now();
+    window.__gptObserver = new MutationObserver(() => { window.__gptLastMutation = Date.now(); });
+    window.__gptObserver.observe(root, {childList: true, subtree: true, characterData: true});
+}
+const first = document.querySelector(arguments[0]);
+let turn = first ? first.parentElement.lastElementChild : null;
+while (turn && !(turn.matches(arguments[0]) && turn.querySelector('.markdown'))) {
+    turn = turn.previousElementSibling;
+}
+let index = 0;
+if (turn) {
+    // Номер хода из data-testid="conversation-turn-N", иначе позиция среди соседей
+    index = parseInt((turn.getAttribute('data-testid').match(/\\d+/) || [])[0], 10)
+        || Array.prototype.indexOf.call(turn.parentElement.children, turn) + 1;
+}
+const blocks = turn ? turn.querySelectorAll('.markdown') : [];
+const last = blocks.length ? blocks[blocks.length - 1] : null;
+const generating = !!document.querySelector(
+    "[data-testid='stop-button'], button[aria-label='Stop generating'], .result-streaming"
+);
+return {
+    turn: index,
+    length: last ? last.textContent.length : 0,
+    text: (arguments[1] && last) ? last.innerText : null,
+    html: (arguments[1] && last && !generating) ? answerHtml(last) : null,
+    generating: generating,
+    alert: (arguments[1] && !generating) ? uiAlertText(arguments[0]) : null,
+    idle_ms: Date.now() - window.__gptLastMutation
+};
+"""
+
+# Установка значения поля ввода так, чтобы React увидел изменение:
+# нативный setter + событие input (для contenteditable - execCommand)
+SET_INPUT_VALUE_JS = """
+const element = arguments[0], text = arguments[1];
+element.focus();
+if (element.isContentEditable) {
+    document.execCommand('selectAll', false, null);
+    document.execCommand('insertText', false, text);
+} else {
+    const setter = Object.getOwnPropertyDescriptor(Object.getPrototypeOf(element), 'value').set;
+    setter.call(element, text);
+}
+element.dispatchEvent(new Event('input', {bubbles: true}));
+"""
+
+INPUT_MODES = ("insert", "js", "typing")
+
+# Cookie сессии ChatGPT; по сроку ее действия сессия продлевается заранее
+SESSION_COOKIE = "__Secure-next-auth.session-token"
+
+# Поля CookieParam, которые принимает Network.setCookies
+COOKIE_PARAM_FIELDS = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires")
+
+# localStorage восстанавливается до выполнения скриптов страницы; уже
+# существующие ключи не перезаписываются, чтобы не откатывать состояние
+RESTORE_LOCAL_STORAGE_JS = """
+if (location.origin === %s) {
+    const items = %s;
+    for (const key in items) {
+        if (localStorage.getItem(key) === null) localStorage.setItem(key, items[key]);
+    }
+}
+"""
+
+HEALTH_JS = """
+return {
+    textarea: !!document.querySelector('textarea'),
+    login_page: location.pathname.startsWith('/auth'),
+    heap_mb: performance.memory ? performance.memory.usedJSHeapSize / 1048576 : null
+};
+"""
+
+# Результаты поиска chromedriver/Chromium, общие для всех клиентов процесса
+_discovery_memo = {}
+_discovery_lock = threading.Lock()
+
+def _file_signature(path):
+    """mtime и размер файла для проверки актуальности кэша"""
+    stat = os.stat(path)
+    return [stat.st_mtime, stat.st_size]
+
+# Что не загружает экономный режим: картинки, шрифты, медиа и сторонняя телеметрия
+LEAN_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp4", "*.webm", "*.mp3", "*.ogg", "*.wav",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*segment.io*", "*segment.com*", "*sentry.io*", "*browser-intake-datadoghq.com*",
+    "*intercom.io*", "*intercomcdn.com*",
+]
+
+# Переключатели Chromium, уменьшающие потребление памяти одним браузером
+LEAN_CHROMIUM_ARGS = [
+    "--blink-settings=imagesEnabled=false",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,BackForwardCache",
+    "--renderer-process-limit=2",
+    "--js-flags=--max-old-space-size=512",
+    "--mute-audio",
+]
+
+# Общие переключатели Chromium для обоих способов управления браузером
+CHROMIUM_ARGS = [
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-blink-features=AutomationControlled",
+    "--disable-extensions",
+    "--disable-gpu",
+    "--window-size=1280,800",
+    "--log-level=3",
+]
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+HIDE_WEBDRIVER_JS = 'Object.defineProperty(navigator, "webdriver", {get: () => undefined})'
+
+# Файлы блокировки профиля Chromium; после аварийного завершения остаются на диске
+PROFILE_LOCK_FILES = ("SingletonLock", "SingletonSocket", "SingletonCookie")
+
+# Ошибки запуска, указывающие на поврежденный профиль; прочие сбои (несовпадение
+# версий chromedriver, нехватка библиотек) профиль не затрагивают
+PROFILE_ERROR_RE = re.compile(
+    r"profile error|profile could not be opened|preferences.{0,40}(corrupt|invalid|unreadable)",
+    re.IGNORECASE
+)
+
+# Сколько перенесенных поврежденных профилей хранить для разбора
+CORRUPT_PROFILES_KEEP = 2
+
+def _pid_alive(pid):
+    """Проверка, что процесс с таким pid существует"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+# Сообщения веб-интерфейса о превышении лимита сообщений аккаунта
+LIMIT_RE = re.compile(
+    r"usage cap|reached (?:our|the|your) (?:\w+ )?limit|hit (?:the|your) .{0,40}limit|"
+    r"too many requests|limit (?:for|of) messages",
+    re.IGNORECASE
+)
+
+class RateLimitError(Exception):
+    """ChatGPT сообщил о превышении лимита сообщений аккаунта"""
+
+class ResponseError(Exception):
+    """Запрос уже отправлен в ChatGPT, но ответ не получен (таймаут, сбой при чтении).
+
+    Повторять такой запрос нельзя: вопрос второй раз появился бы в разговоре
+    и еще раз расходовал бы лимит аккаунта.
+    """
+
+def find_limit_message(text):
+    """Строка с сообщением о лимите в тексте баннеров интерфейса (UI_ALERT_JS) или None"""
+    match = LIMIT_RE.search(text or "")
+    if not match:
+        return None
+    start = text.rfind("\n", 0, match.start()) + 1
+    end = text.find("\n", match.end())
+    return text[start:end if end != -1 else len(text)].strip()
+
+def cookie_params(cookies):
+    """Сохраненные cookies в виде CookieParam для Network.setCookies"""
+    params = []
+    for cookie in cookies:
+        param = {key: cookie[key] for key in COOKIE_PARAM_FIELDS if key in cookie}
+        # Сессионные cookies передаются без срока
+        if param.get("expires", -1) < 0:
+            param.pop("expires", None)
+        params.append(param)
+    return params
+
+def url_origin(url):
+    """Origin адреса (схема и хост), как location.origin в браузере"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+def process_tree_rss_mb(root_pid):
+    """Суммарный RSS процесса и всех его потомков (МБ), только Linux"""
+    if not root_pid or not os.path.isdir("/proc"):
+        return None
+    children = {}
+    rss = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/status", "r") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            continue
+        pid = int(entry)
+        children.setdefault(int(fields.get("PPid", "0").strip()), []).append(pid)
+        rss[pid] = int(fields.get("VmRSS", "0 kB").split()[0])
+    total_kb = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        total_kb += rss.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total_kb / 1024
+
+def _binary_version(path):
+    """Версия бинарника по --version"""
+    try:
+        result = subprocess.run([path, '--version'], capture_output=True, text=True, timeout=10)
+        return result.stdout.strip() or None
+    except Exception:
+        return None
+
+class BrowserSession:
+    """Часть сессии ChatGPT, не зависящая от способа управления браузером.
+
+    Поиск Chromium и chromedriver, постоянный профиль, файл сессии (cookies и
+    localStorage), выбор страницы перед отправкой, правило завершения ответа
+    и история. Общая для ChatGPTClient (Selenium) и CDPChatGPTClient, которые
+    только выполняют команды в браузере.
+    """
+
+    def __init__(self, cookie_path="cookies.json", discovery_cache_path="driver_cache.json", profile_dir=None,
+                 base_url=CHATGPT_URL, history_size=100, response_timeout=180, response_stable_seconds=1.0,
+                 reload_every=0):
         self.cookie_path = cookie_path
-        self.history = []
+        self.discovery_cache_path = discovery_cache_path
+        self.profile_dir = os.path.abspath(profile_dir) if profile_dir else None
+        # Адрес веб-интерфейса; для бенчмарков указывает на локальную заглушку
+        self.base_url = base_url.rstrip("/")
+        # Главная страница, на которую фактически попал браузер: chat.openai.com
+        # переадресует на chatgpt.com
+        self.home_url = url_origin(self.base_url)
+        self.response_timeout = response_timeout
+        self.response_stable_seconds = response_stable_seconds
+        # Через сколько сообщений без перехода перезагружать страницу, чтобы освободить память DOM
+        self.reload_every = reload_every
+        self.messages_since_load = 0
+        # Последние вопросы и ответы; полный журнал ведет HistoryStore
+        self.history = deque(maxlen=history_size)
+        self.last_html = None
+        self._pending = None
         self.logger = logging.getLogger(__name__)
 
-    def _find_chromedriver(self):
+    def find_chromedriver(self):
         """Поиск chromedriver с несколькими методами"""
         # Метод 1: Проверяем системный chromedriver
         chromedriver_paths = [
@@ -69,8 +400,8 @@ class ChatGPTClient:
         
         return None
 
-    def _check_chromium_installation(self):
-        """Проверка установки Chromium"""
+    def find_chromium(self):
+        """Поиск Chromium"""
         chromium_paths = [
             "/usr/bin/chromium-browser",
             "/usr/bin/chromium",
@@ -82,46 +413,346 @@ class ChatGPTClient:
         for path in chromium_paths:
             if path and os.path.exists(path):
                 self.logger.info(f"Найден Chromium: {path}")
-                return True
+                return path
         
         # Проверяем через команду
         try:
             result = subprocess.run(['which', 'chromium-browser'], 
                                   capture_output=True, text=True, timeout=10)
             if result.returncode == 0:
-                self.logger.info(f"Найден Chromium в PATH: {result.stdout.strip()}")
-                return True
+                path = result.stdout.strip()
+                self.logger.info(f"Найден Chromium в PATH: {path}")
+                return path
         except Exception:
             pass
         
-        return False
+        return None
+
+    def _load_discovery_cache(self):
+        """Чтение кэша путей к бинарникам с диска"""
+        if not self.discovery_cache_path or not os.path.exists(self.discovery_cache_path):
+            return {}
+        try:
+            with open(self.discovery_cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Ошибка при чтении кэша драйвера: {e}")
+            return {}
+
+    def _save_discovery_cache(self, key, entry):
+        """Сохранение записи кэша путей к бинарникам на диск"""
+        if not self.discovery_cache_path:
+            return
+        try:
+            cache = self._load_discovery_cache()
+            cache[key] = entry
+            # Кэш общий для сессий в разных рабочих процессах
+            tmp_path = f"{self.discovery_cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.discovery_cache_path)
+        except Exception as e:
+            self.logger.warning(f"Ошибка при сохранении кэша драйвера: {e}")
+
+    def cached_binary(self, key, discover):
+        """Путь к бинарнику из кэша или результат поиска discover().
+
+        Запись кэша действительна, пока у файла не изменились mtime и размер,
+        поэтому переподключения и перезапуски не повторяют поиск и не ходят в сеть.
+        """
+        with _discovery_lock:
+            entry = _discovery_memo.get(key) or self._load_discovery_cache().get(key)
+            if entry:
+                try:
+                    if _file_signature(entry["path"]) == entry["signature"]:
+                        _discovery_memo[key] = entry
+                        return entry["path"]
+                except (OSError, KeyError, TypeError):
+                    pass
+                self.logger.info(f"Кэш для {key} устарел, выполняем поиск заново")
+                _discovery_memo.pop(key, None)
+            
+            path = discover()
+            if not path:
+                return None
+            entry = {"path": path, "signature": _file_signature(path), "version": _binary_version(path)}
+            _discovery_memo[key] = entry
+            self._save_discovery_cache(key, entry)
+            self.logger.info(f"{key}: {entry['version'] or 'версия неизвестна'}")
+            return path
+
+    def prepare_profile(self):
+        """Подготовка постоянного профиля: зависшие блокировки и флаг аварийного выхода"""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        
+        # SingletonLock - симлинк вида "hostname-pid"; если процесса нет, блокировка зависла
+        lock_path = os.path.join(self.profile_dir, "SingletonLock")
+        if os.path.islink(lock_path):
+            owner = os.readlink(lock_path)
+            host, _, pid = owner.rpartition("-")
+            if host == socket.gethostname() and pid.isdigit() and _pid_alive(int(pid)):
+                raise Exception(f"Профиль {self.profile_dir} уже используется процессом {pid}")
+            self.logger.warning(f"Снимаем зависшую блокировку профиля ({owner})")
+            for name in PROFILE_LOCK_FILES:
+                path = os.path.join(self.profile_dir, name)
+                if os.path.lexists(path):
+                    os.remove(path)
+        
+        # После аварийного завершения Chromium предлагает восстановить вкладки;
+        # нечитаемые настройки считаем признаком поврежденного профиля
+        preferences_path = os.path.join(self.profile_dir, "Default", "Preferences")
+        if os.path.exists(preferences_path):
+            try:
+                with open(preferences_path, "r", encoding="utf-8") as f:
+                    preferences = json.load(f)
+                profile = preferences.setdefault("profile", {})
+                if profile.get("exit_type") != "Normal":
+                    profile["exit_type"] = "Normal"
+                    profile["exited_cleanly"] = True
+                    with open(preferences_path, "w", encoding="utf-8") as f:
+                        json.dump(preferences, f)
+            except ValueError:
+                self.logger.warning("Настройки профиля повреждены")
+                self.quarantine_profile()
+                os.makedirs(self.profile_dir, exist_ok=True)
+
+    def quarantine_profile(self):
+        """Перенос поврежденного профиля в сторону; следующий запуск создаст новый"""
+        backup_path = f"{self.profile_dir}.corrupt-{int(time.time())}"
+        os.rename(self.profile_dir, backup_path)
+        self.logger.warning(f"Профиль перенесен в {backup_path}, создаем новый")
+        # Старые копии удаляются, чтобы повторные сбои не заполнили диск
+        backups = sorted(Path(self.profile_dir).parent.glob(f"{Path(self.profile_dir).name}.corrupt-*"))
+        for path in backups[:-CORRUPT_PROFILES_KEEP]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def write_state(self, cookies, local_storage, origin):
+        """Запись cookies и localStorage (вместе с origin, которому он принадлежит) в файл сессии"""
+        state = {"saved_at": time.time(), "cookies": cookies, "local_storage": local_storage, "origin": origin}
+        # Файл содержит токены сессии: доступ только владельцу
+        tmp_path = f"{self.cookie_path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cookie_path)
+        self.logger.info("Cookies сохранены")
+
+    def load_state(self):
+        """Чтение сохраненной сессии; None, если cookie сессии нет или он истек"""
+        if not os.path.exists(self.cookie_path):
+            return None
+        try:
+            with open(self.cookie_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Ошибка при чтении cookies: {e}")
+            return None
+        now = time.time()
+        # Сессионные cookies (expires = -1) живут до закрытия браузера, их оставляем
+        cookies = [c for c in state.get("cookies", []) if c.get("expires", -1) < 0 or c["expires"] > now]
+        if not any(c["name"] == SESSION_COOKIE for c in cookies):
+            self.logger.info("⚠️ Cookie сессии отсутствует или истек")
+            return None
+        state["cookies"] = cookies
+        return state
+
+    def export_history(self, filename="chat_history.txt"):
+        """Экспорт истории чата"""
+        try:
+            with open(filename, "w", encoding="utf-8") as f:
+                for i, msg in enumerate(self.history, 1):
+                    f.write(f"[{i}] Вопрос: {msg['prompt']}\nОтвет: {msg['response']}\n\n")
+            self.logger.info(f"История сохранена в {filename}")
+        except Exception as e:
+            self.logger.error(f"Ошибка при сохранении истории: {e}")
+
+    def restore_script(self, state):
+        """Скрипт восстановления localStorage для origin, на котором он был сохранен, или None"""
+        self.home_url = state.get("origin") or self.home_url
+        if not state.get("local_storage"):
+            return None
+        return RESTORE_LOCAL_STORAGE_JS % (json.dumps(self.home_url), json.dumps(state["local_storage"]))
+
+    def remember_home(self, url):
+        """Главная страница после переадресаций по фактическому адресу вкладки"""
+        self.home_url = url_origin(url)
+
+    def navigation_target(self, current_url, conversation_url=None):
+        """Куда перейти перед отправкой: (адрес или None, открыта ли главная страница).
+
+        None - нужный разговор уже открыт. Если открыта главная страница,
+        переходить нужно, только если на ней уже есть ответы.
+        """
+        current_url = current_url.rstrip("/")
+        if conversation_url:
+            if current_url == conversation_url.rstrip("/"):
+                if not self.reload_every or self.messages_since_load < self.reload_every:
+                    return None, False
+                # Длинная переписка на одной странице копит память DOM
+                self.logger.info("Перезагружаем страницу разговора для освобождения памяти")
+            return conversation_url, False
+        return f"{self.base_url}/", current_url == self.home_url
+
+    def page_loaded(self, url, conversation_url=None):
+        """Страница разговора загружена заново"""
+        self.messages_since_load = 0
+        if not conversation_url:
+            self.remember_home(url)
+
+    def start_response(self, prompt, initial_turn):
+        """Запрос отправлен: ждем ответ после хода initial_turn"""
+        self.messages_since_load += 1
+        self.last_html = None
+        self._pending = {
+            "prompt": prompt,
+            "turn": initial_turn,
+            "last_length": -1,
+            "deadline": time.monotonic() + self.response_timeout,
+        }
+
+    def track(self, state):
+        """Текст ответа и признак завершения по состоянию страницы (RESPONSE_STATE_JS).
+
+        Ответ считается готовым, когда появился новый блок ответа, кнопка
+        остановки генерации исчезла, а DOM не менялся в течение окна стабильности.
+        """
+        pending = self._pending
+        if pending is None:
+            raise RuntimeError("Нет отправленного сообщения")
+        if state["turn"] <= pending["turn"]:
+            text, done = "", False
+            # Вместо ответа интерфейс показал сообщение о лимите аккаунта
+            limit_message = find_limit_message(state["alert"])
+            if limit_message:
+                self._pending = None
+                raise RateLimitError(limit_message)
+        else:
+            text = (state["text"] or "").strip()
+            done = (not state["generating"] and state["length"] == pending["last_length"]
+                    and state["idle_ms"] >= self.response_stable_seconds * 1000)
+            pending["last_length"] = state["length"]
+        if done:
+            self._pending = None
+            self.last_html = state["html"]
+            self.logger.info("Ответ получен")
+            self.history.append({"prompt": pending["prompt"], "response": text})
+        return text, done
+
+    @property
+    def expired(self):
+        """Время ожидания ответа истекло"""
+        return self._pending is not None and time.monotonic() > self._pending["deadline"]
+
+    def timeout_error(self, alert):
+        """Ошибка истекшего ожидания: лимит из текста баннеров alert или таймаут"""
+        self._pending = None
+        # Баннер о лимите мог появиться, пока генерация еще шла
+        limit_message = find_limit_message(alert)
+        if limit_message:
+            return RateLimitError(limit_message)
+        return TimeoutException("Генерация ответа не завершилась за отведенное время")
+
+def health_report(page=None, session_expires_at=None):
+    """Результат probe_health по данным HEALTH_JS и сроку cookie сессии; без page - сессия не отвечает"""
+    result = {"healthy": False, "logged_in": False, "heap_mb": None, "session_expires_in": None}
+    if page is None:
+        return result
+    result["logged_in"] = page["textarea"] and not page["login_page"]
+    result["heap_mb"] = page["heap_mb"]
+    if session_expires_at:
+        result["session_expires_in"] = session_expires_at - time.time()
+    result["healthy"] = result["logged_in"]
+    return result
+
+def failure_reply(error, logger):
+    """Текст для пользователя, когда send_message не получил ответ"""
+    if isinstance(error, ResponseError) and error.__cause__:
+        error = error.__cause__
+    if isinstance(error, NoSuchElementException):
+        logger.warning("Не удалось найти ответ")
+        return "Извините, не удалось получить ответ от ChatGPT"
+    if isinstance(error, TimeoutException):
+        logger.error(f"Таймаут при отправке сообщения: {error}")
+        return "Извините, произошла ошибка при получении ответа"
+    logger.error(f"Ошибка при отправке сообщения: {error}")
+    return f"Произошла ошибка: {str(error)}"
+
+class ChatGPTClient:
+    def __init__(self, email, password, headless=False, timeout=30, cookie_path="cookies.json",
+                 discovery_cache_path="driver_cache.json", response_timeout=180, response_stable_seconds=1.0, poll_interval=0.25,
+                 input_mode="insert", history_size=100, profile_dir=None,
+                 lean_mode=False, reload_every=0, base_url=CHATGPT_URL):
+        if input_mode not in INPUT_MODES:
+            raise ValueError(f"Неизвестный способ ввода: {input_mode}. Допустимые: {', '.join(INPUT_MODES)}")
+        self.email = email
+        self.password = password
+        self.headless = headless
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.input_mode = input_mode
+        self.lean_mode = lean_mode
+        self.session = BrowserSession(
+            cookie_path=cookie_path, discovery_cache_path=discovery_cache_path, profile_dir=profile_dir,
+            base_url=base_url, history_size=history_size, response_timeout=response_timeout,
+            response_stable_seconds=response_stable_seconds, reload_every=reload_every
+        )
+        self.driver = None
+        self.wait = None
+        self._restore_script_id = None
+        self.logger = logging.getLogger(__name__)
 
     def setup_driver(self):
         """Настройка Chrome/Chromium WebDriver"""
         # Проверяем установку Chromium
-        if not self._check_chromium_installation():
+        if not self.session.cached_binary("chromium", self.session.find_chromium):
             raise Exception("Chromium не найден. Установите Chromium: sudo apt install chromium-browser")
         
         options = Options()
         if self.headless:
             options.add_argument("--headless=new")
 
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_argument("--disable-extensions")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--window-size=1280,800")
-        options.add_argument("--log-level=3")
+        for argument in CHROMIUM_ARGS:
+            options.add_argument(argument)
         options.add_experimental_option("excludeSwitches", ["enable-automation"])
         options.add_experimental_option("useAutomationExtension", False)
-        options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+        options.add_argument(f"user-agent={USER_AGENT}")
+        if self.lean_mode:
+            for argument in LEAN_CHROMIUM_ARGS:
+                options.add_argument(argument)
+
+        # Постоянный профиль сохраняет HTTP-кэш, service workers и вход между запусками
+        profile_dir = self.session.profile_dir
+        if profile_dir:
+            self.session.prepare_profile()
+            options.add_argument(f"--user-data-dir={profile_dir}")
 
         # Поиск chromedriver
-        chromedriver_path = self._find_chromedriver()
+        chromedriver_path = self.session.cached_binary("chromedriver", self.session.find_chromedriver)
         if not chromedriver_path:
             raise Exception("Не удалось найти chromedriver. Установите chromedriver: sudo apt install chromium-chromedriver")
         
+        try:
+            self._start_driver(chromedriver_path, options)
+        except Exception as e:
+            if not profile_dir or not PROFILE_ERROR_RE.search(str(e)):
+                raise
+            # Chromium сообщил о поврежденном профиле: начинаем с чистого
+            self.session.quarantine_profile()
+            self.session.prepare_profile()
+            self._start_driver(chromedriver_path, options)
+        
+        self.wait = WebDriverWait(self.driver, self.timeout)
+        
+        # Отключаем navigator.webdriver через JS
+        self.driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': HIDE_WEBDRIVER_JS})
+        
+        # Экономный режим: запросы к ненужным ресурсам отбрасываются самим браузером
+        if self.lean_mode:
+            self.driver.execute_cdp_cmd('Network.enable', {})
+            self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': LEAN_BLOCKED_URLS})
+
+    def _start_driver(self, chromedriver_path, options):
+        """Запуск Chrome/Chromium WebDriver"""
         try:
             service = Service(chromedriver_path)
             self.driver = webdriver.Chrome(service=service, options=options)
@@ -136,37 +767,30 @@ class ChatGPTClient:
             except Exception as e2:
                 self.logger.error(f"Ошибка запуска Chrome без Service: {e2}")
                 raise Exception(f"Не удалось запустить Chrome/Chromium. Убедитесь, что версии Chromium и chromedriver совместимы: {e2}")
-        
-        self.wait = WebDriverWait(self.driver, self.timeout)
-        
-        # Отключаем navigator.webdriver через JS
-        self.driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
-            'source': 'Object.defineProperty(navigator, "webdriver", {get: () => undefined})'
-        })
 
     def save_cookies(self):
-        """Сохранение cookies"""
+        """Сохранение cookies и localStorage в JSON"""
         try:
-            with open(self.cookie_path, "wb") as f:
-                pickle.dump(self.driver.get_cookies(), f)
-            self.logger.info("Cookies сохранены")
+            cookies = self.driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+            local_storage = self.driver.execute_script("return Object.assign({}, window.localStorage)")
+            self.session.write_state(cookies, local_storage, url_origin(self.driver.current_url))
         except Exception as e:
             self.logger.warning(f"Ошибка при сохранении cookies: {e}")
 
     def load_cookies(self):
-        """Загрузка cookies"""
-        if not os.path.exists(self.cookie_path):
+        """Восстановление cookies и localStorage через CDP до первой загрузки страницы"""
+        state = self.session.load_state()
+        if not state:
             return False
         try:
-            with open(self.cookie_path, "rb") as f:
-                cookies = pickle.load(f)
-            self.driver.get("https://chat.openai.com")
-            for cookie in cookies:
-                try:
-                    self.driver.add_cookie(cookie)
-                except Exception:
-                    pass
-            self.driver.refresh()
+            self.driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookie_params(state["cookies"])})
+            restore_script = self.session.restore_script(state)
+            if restore_script:
+                if self._restore_script_id:
+                    self.driver.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument",
+                                                {"identifier": self._restore_script_id})
+                result = self.driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": restore_script})
+                self._restore_script_id = result.get("identifier")
             self.logger.info("Cookies загружены")
             return True
         except Exception as e:
@@ -176,21 +800,26 @@ class ChatGPTClient:
     def login(self):
         """Вход в ChatGPT"""
         try:
-            self.logger.info("Открываем ChatGPT...")
-            self.driver.get("https://chat.openai.com")
-            time.sleep(random.uniform(1.5, 2.5))
-
-            # Пытаемся войти через cookies
+            # Пытаемся войти через cookies: они установлены до загрузки страницы,
+            # поэтому теплый вход занимает одну загрузку
             if self.load_cookies():
+                self.logger.info("Открываем ChatGPT...")
+                self.driver.get(self.session.base_url)
                 try:
-                    self.wait.until(EC.presence_of_element_located((By.TAG_NAME, "textarea")))
-                    self.logger.info("✅ Вход через сохраненные cookies")
-                    return True
-                except:
-                    self.logger.info("⚠️ Cookies устарели, пробуем войти вручную...")
+                    self.wait.until(EC.any_of(
+                        EC.presence_of_element_located((By.TAG_NAME, "textarea")),
+                        EC.url_contains("/auth")
+                    ))
+                    if self.check_health():
+                        self.session.remember_home(self.driver.current_url)
+                        self.logger.info("✅ Вход через сохраненные cookies")
+                        return True
+                except TimeoutException:
+                    pass
+                self.logger.info("⚠️ Cookies устарели, пробуем войти вручную...")
 
             # Ручной вход
-            self.driver.get("https://chat.openai.com/auth/login")
+            self.driver.get(f"{self.session.base_url}/auth/login")
             login_button = self.wait.until(
                 EC.element_to_be_clickable((By.XPATH, "//button[contains(., 'Log in')]"))
             )
@@ -217,6 +846,7 @@ class ChatGPTClient:
             # Ждем загрузки чата
             self.logger.info("Ожидаем загрузки чата...")
             self.wait.until(EC.presence_of_element_located((By.TAG_NAME, "textarea")))
+            self.session.remember_home(self.driver.current_url)
             
             self.logger.info("✅ Успешный вход в ChatGPT")
             self.save_cookies()
@@ -235,45 +865,153 @@ class ChatGPTClient:
             element.send_keys(char)
             time.sleep(random.uniform(min_delay, max_delay))
 
+    def enter_prompt(self, element, text):
+        """Ввод запроса выбранным способом.
+
+        insert - CDP Input.insertText одной командой, js - установка значения
+        через JS с событием input, typing - посимвольный ввод как у человека.
+        """
+        if self.input_mode == "typing":
+            self.slow_typing(element, text)
+            time.sleep(random.uniform(0.2, 0.5))
+        elif self.input_mode == "js":
+            self.driver.execute_script(SET_INPUT_VALUE_JS, element, text)
+        else:
+            # Вставка идет в элемент с фокусом, фокус получен через click()
+            self.driver.execute_cdp_cmd("Input.insertText", {"text": text})
+
+    def _response_state(self, include_text=False):
+        """Текущее состояние последнего ответа на странице"""
+        return self.driver.execute_script(RESPONSE_STATE_JS, TURN_SELECTOR, include_text)
+
+    def current_conversation_url(self):
+        """URL текущего разговора (/c/<id>) или None для нового разговора"""
+        url = self.driver.current_url
+        return url if "/c/" in url else None
+
+    def open_conversation(self, conversation_url=None):
+        """Прямой переход в разговор по URL; без URL - в новый разговор"""
+        target, on_home = self.session.navigation_target(self.driver.current_url, conversation_url)
+        # Пустая страница нового разговора уже открыта
+        if not target or (on_home and self._response_state()["turn"] == 0):
+            return
+        self.logger.info(f"Переходим в разговор: {target}")
+        self.driver.get(target)
+        self.wait.until(EC.presence_of_element_located((By.TAG_NAME, "textarea")))
+        self.session.page_loaded(self.driver.current_url, conversation_url)
+
+    def submit_message(self, message, conversation_url=None):
+        """Ввод сообщения и запуск генерации ответа без ожидания результата"""
+        self.open_conversation(conversation_url)
+        
+        # Находим поле ввода
+        textarea = self.wait.until(EC.presence_of_element_located((By.TAG_NAME, "textarea")))
+        initial_turn = self._response_state()["turn"]
+        textarea.click()
+        textarea.clear()
+        
+        # Вводим сообщение; посимвольный ввод остается только для формы входа
+        self.enter_prompt(textarea, message)
+        textarea.send_keys(Keys.ENTER)
+        self.session.start_response(message, initial_turn)
+        self.logger.info("Ожидаем ответ от ChatGPT...")
+
+    def poll_response(self):
+        """Текущий текст ответа и признак завершения генерации (см. BrowserSession.track)"""
+        text, done = self.session.track(self._response_state(include_text=True))
+        if not done and self.session.expired:
+            raise self.session.timeout_error(self._limit_alert())
+        return text, done
+
+    def last_response_html(self):
+        """Последний ответ в HTML-разметке Telegram (код, списки, ссылки)"""
+        return self.session.last_html
+
+    def stream_message(self, message, conversation_url=None):
+        """Отправка сообщения с постепенной выдачей текста ответа по мере генерации"""
+        self.submit_message(message, conversation_url)
+        last_text = None
+        while True:
+            text, done = self.poll_response()
+            if text and text != last_text:
+                last_text = text
+                yield text
+            if done:
+                return
+            time.sleep(self.poll_interval)
+
+    def get_response(self, message, conversation_url=None):
+        """Отправка сообщения и получение ответа; ошибки пробрасываются вызывающему"""
+        response = ""
+        for response in self.stream_message(message, conversation_url):
+            pass
+        if not response:
+            raise NoSuchElementException("Не удалось найти ответ")
+        return response
+
     def send_message(self, message):
         """Отправка сообщения в ChatGPT и получение ответа"""
         try:
-            # Находим поле ввода
-            textarea = self.wait.until(EC.presence_of_element_located((By.TAG_NAME, "textarea")))
-            textarea.click()
-            textarea.clear()
-            
-            # Вводим сообщение медленно
-            self.slow_typing(textarea, message)
-            time.sleep(random.uniform(0.2, 0.5))
-            textarea.send_keys(Keys.ENTER)
+            return self.get_response(message)
+        except Exception as e:
+            return failure_reply(e, self.logger)
 
-            # Ждем начала генерации ответа
-            self.logger.info("Ожидаем ответ от ChatGPT...")
-            self.wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "[data-testid^='conversation-turn'] .markdown"))
-            )
-            
-            # Ждем завершения генерации
-            time.sleep(2)
-
-            # Получаем ответ
-            answers = self.driver.find_elements(By.CSS_SELECTOR, "[data-testid^='conversation-turn'] .markdown")
-            if answers:
-                response = answers[-1].text.strip()
-                self.logger.info("Ответ получен")
-                self.history.append({"prompt": message, "response": response})
-                return response
-            else:
-                self.logger.warning("Не удалось найти ответ")
-                return "Извините, не удалось получить ответ от ChatGPT"
-                
-        except TimeoutException as e:
-            self.logger.error(f"Таймаут при отправке сообщения: {e}")
-            return "Извините, произошла ошибка при получении ответа"
+    def probe_health(self):
+        """Подробная проверка сессии: страница жива, вход выполнен, память, срок cookies"""
+        if not self.driver:
+            return health_report()
+        try:
+            page = self.driver.execute_script(HEALTH_JS)
+            cookie = self.driver.get_cookie(SESSION_COOKIE)
+        except Exception as e:
+            # Упавшая вкладка или браузер не отвечают на команды
+            self.logger.warning(f"Сессия не отвечает: {e}")
+            return health_report()
+        return health_report(page, cookie.get("expiry") if cookie else None)
+
+    def check_health(self):
+        """Быстрая проверка работоспособности сессии"""
+        if not self.driver:
+            return False
+        try:
+            return bool(self.driver.execute_script("return !!document.querySelector('textarea')"))
         except Exception as e:
-            self.logger.error(f"Ошибка при отправке сообщения: {e}")
-            return f"Произошла ошибка: {str(e)}"
+            self.logger.warning(f"Сессия не отвечает: {e}")
+            return False
+
+    def refresh_session(self):
+        """Продление сессии до истечения cookies; при неудаче - полный вход"""
+        try:
+            self.driver.get(self.session.base_url)
+            self.wait.until(EC.presence_of_element_located((By.TAG_NAME, "textarea")))
+            self.session.remember_home(self.driver.current_url)
+            self.save_cookies()
+            self.logger.info("Сессия продлена")
+            return True
+        except Exception as e:
+            self.logger.warning(f"Не удалось продлить сессию, выполняем вход заново: {e}")
+            return self.login()
+
+    def driver_pid(self):
+        """PID процесса chromedriver, от которого запущен браузер"""
+        try:
+            return self.driver.service.process.pid
+        except Exception:
+            return None
+
+    def memory_usage(self):
+        """Суммарный RSS chromedriver и всех процессов браузера (МБ), только Linux.
+
+        Не обращается к WebDriver, поэтому безопасен для вызова из любого потока.
+        """
+        return process_tree_rss_mb(self.driver_pid())
+
+    def _limit_alert(self):
+        """Текст баннеров интерфейса (LIMIT_ALERT_JS) или None"""
+        try:
+            return self.driver.execute_script(LIMIT_ALERT_JS, TURN_SELECTOR)
+        except Exception:
+            return None
 
     def close(self):
         """Закрытие браузера"""
@@ -283,10 +1021,4 @@ class ChatGPTClient:
 
     def export_history(self, filename="chat_history.txt"):
         """Экспорт истории чата"""
-        try:
-            with open(filename, "w", encoding="utf-8") as f:
-                for i, msg in enumerate(self.history, 1):
-                    f.write(f"[{i}] Вопрос: {msg['prompt']}\nОтвет: {msg['response']}\n\n")
-            self.logger.info(f"История сохранена в {filename}")
-        except Exception as e:
-            self.logger.error(f"Ошибка при сохранении истории: {e}")
+        self.session.export_history(filename)
@@ -79,7 +79,7 @@ check_environment() {
 
 # Создание директорий
 create_directories() {
-    mkdir -p logs
+    mkdir -p logs sessions
     print_success "Директории созданы"
 }
 
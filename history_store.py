@@ -0,0 +1,72 @@
+import json
+import logging
+import os
+import threading
+import time
+
+class HistoryStore:
+    """Журнал вопросов и ответов в формате JSONL с ротацией.
+
+    Каждая запись дописывается в файл сразу после ответа и в памяти не
+    хранится. Когда файл превышает max_bytes, он переименовывается в
+    .1, .2, ... (не более backups архивов).
+    """
+
+    def __init__(self, path, max_bytes=5 * 1024 * 1024, backups=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def append(self, prompt, response, user_id=None):
+        """Добавление записи в журнал"""
+        record = {"ts": time.time(), "user_id": user_id, "prompt": prompt, "response": response}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(line.encode("utf-8")) > self.max_bytes:
+                    self._rotate()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except Exception as e:
+                self.logger.error(f"Ошибка при записи истории: {e}")
+
+    def _rotate(self):
+        """Сдвиг архивов: history.jsonl -> .1 -> .2 ..."""
+        for index in range(self.backups, 0, -1):
+            source = self.path if index == 1 else f"{self.path}.{index - 1}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index}")
+        if not self.backups and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _files(self):
+        """Файлы журнала от старых к новым"""
+        files = [f"{self.path}.{index}" for index in range(self.backups, 0, -1)]
+        files.append(self.path)
+        return [path for path in files if os.path.exists(path)]
+
+    def iter_records(self, user_id=None):
+        """Построчное чтение журнала, при необходимости только одного пользователя"""
+        for path in self._files():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if user_id is None or record.get("user_id") == user_id:
+                        yield record
+
+    def export(self, filename, user_id=None):
+        """Потоковый экспорт истории в текстовый файл; возвращает число записей"""
+        count = 0
+        with open(filename, "w", encoding="utf-8") as f:
+            for count, record in enumerate(self.iter_records(user_id), 1):
+                f.write(f"[{count}] Вопрос: {record['prompt']}\nОтвет: {record['response']}\n\n")
+        self.logger.info(f"История сохранена в {filename}")
+        return count
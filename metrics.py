@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Границы корзин гистограмм (сек): от долей секунды до нескольких минут
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+logger = logging.getLogger(__name__)
+
+class Histogram:
+    """Гистограмма длительностей в формате Prometheus с окном последних значений для перцентилей"""
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS, window=1000):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def percentile(self, q):
+        """Перцентиль по последним наблюдениям"""
+        if not self.recent:
+            return None
+        values = sorted(self.recent)
+        return values[min(int(q * len(values)), len(values) - 1)]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for bound, count in zip(self.buckets, self.counts):
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {count}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+class Counter:
+    """Монотонно растущий счетчик"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+class Gauge:
+    """Текущее значение величины (например, глубина очереди)"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {self.value}"]
+
+class MetricsRegistry:
+    """Реестр метрик бота; потокобезопасен, так как метрики пишут и потоки браузеров"""
+
+    def __init__(self, prefix="tgbot_"):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text):
+        full_name = self.prefix + name
+        metric = self._metrics.get(full_name)
+        if metric is None:
+            metric = self._metrics[full_name] = cls(full_name, help_text or name)
+        return metric
+
+    def observe(self, name, value, help_text=None):
+        """Наблюдение длительности в гистограмме name"""
+        with self._lock:
+            self._get(Histogram, name, help_text).observe(value)
+
+    def inc(self, name, amount=1, help_text=None):
+        """Увеличение счетчика name"""
+        with self._lock:
+            self._get(Counter, name, help_text).value += amount
+
+    def set(self, name, value, help_text=None):
+        """Установка значения name"""
+        with self._lock:
+            self._get(Gauge, name, help_text).value = value
+
+    @contextmanager
+    def timer(self, name, help_text=None):
+        """Замер длительности блока кода"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, help_text)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            lines = []
+            for name in sorted(self._metrics):
+                lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Краткая сводка для команды /stats"""
+        with self._lock:
+            lines = []
+            for name in sorted(self._metrics):
+                metric = self._metrics[name]
+                short_name = name[len(self.prefix):]
+                if isinstance(metric, Histogram):
+                    if not metric.count:
+                        continue
+                    lines.append(
+                        f"{short_name}: n={metric.count}, p50={metric.percentile(0.5):.2f}с, "
+                        f"p95={metric.percentile(0.95):.2f}с"
+                    )
+                else:
+                    lines.append(f"{short_name}: {metric.value}")
+        return "\n".join(lines)
+
+# Общий реестр метрик процесса
+metrics = MetricsRegistry()
+
+async def start_metrics_server(host, port, registry=metrics):
+    """Минимальный HTTP-сервер, отдающий метрики на /metrics"""
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            # Заголовки запроса не нужны, но их надо дочитать
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", registry.render().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.warning(f"Ошибка при отдаче метрик: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Optional
+from metrics import metrics
+
+class QueueFullError(Exception):
+    """Очередь запросов переполнена"""
+
+@dataclass(eq=False)
+class ChatRequest:
+    """Запрос пользователя, ожидающий обработки в ChatGPT"""
+    user_id: int
+    chat_id: int
+    prompt: str
+    processing_message: Any
+    reply_to: Any
+    enqueued_at: float = field(default_factory=time.monotonic)
+    position: int = 0
+    # Ключ объединения одинаковых запросов, если запрос ведущий
+    flight_key: Optional[str] = None
+    # id в журнале запросов, переживающем перезапуск
+    request_id: Optional[int] = None
+
+class RequestScheduler:
+    """Планировщик запросов к ChatGPT.
+
+    У каждого пользователя своя FIFO-очередь, пользователи обслуживаются по
+    кругу, поэтому один активный пользователь не задерживает остальных.
+    Запросы одного пользователя выполняются строго по одному, так как они
+    идут в один и тот же разговор ChatGPT.
+    Общий размер очереди ограничен; при переполнении новые запросы отклоняются.
+    """
+
+    def __init__(self, handler, workers=1, max_queue_size=50, max_per_user=5, on_position_change=None):
+        self.handler = handler
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.max_per_user = max_per_user
+        self.on_position_change = on_position_change
+        self._queues = OrderedDict()
+        self._size = 0
+        self._available = asyncio.Condition()
+        self._tasks = []
+        self._active_users = set()
+        self._notify_tasks = set()
+        self.in_progress = 0
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def size(self):
+        """Количество запросов, ожидающих обработки"""
+        return self._size
+
+    def start(self):
+        """Запуск обработчиков очереди"""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        """Остановка обработчиков очереди"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, request):
+        """Постановка запроса в очередь; возвращает позицию в очереди (с 1)"""
+        queue = self._queues.get(request.user_id)
+        if self._size >= self.max_queue_size:
+            metrics.inc("queue_rejected_total", help_text="Запросы, отклоненные из-за переполнения очереди")
+            raise QueueFullError("Очередь переполнена, попробуйте позже")
+        if queue and len(queue) >= self.max_per_user:
+            metrics.inc("queue_rejected_total", help_text="Запросы, отклоненные из-за переполнения очереди")
+            raise QueueFullError(f"У вас уже {len(queue)} запросов в очереди, дождитесь ответа на них")
+
+        async with self._available:
+            if queue is None:
+                queue = self._queues[request.user_id] = deque()
+            queue.append(request)
+            self._size += 1
+            metrics.set("queue_depth", self._size, "Запросы, ожидающие обработки")
+            request.position = self._position(request)
+            # Новый пользователь в круге может сдвинуть запросы остальных
+            self._refresh_positions()
+            self._available.notify()
+        return request.position
+
+    def _position(self, request):
+        """Позиция запроса с учетом круговой очередности пользователей.
+
+        За каждый круг каждый пользователь получает по одному запросу, поэтому
+        перед k-м запросом пользователя стоят до k+1 запросов пользователей,
+        идущих раньше по кругу, и до k запросов остальных.
+        """
+        index = self._queues[request.user_id].index(request)
+        position = index + 1
+        before = True
+        for user_id, queue in self._queues.items():
+            if user_id == request.user_id:
+                before = False
+            else:
+                position += min(len(queue), index + 1 if before else index)
+        return position
+
+    def _pick_user(self):
+        """Первый по кругу пользователь без запроса в обработке"""
+        for user_id in self._queues:
+            if user_id not in self._active_users:
+                return user_id
+        return None
+
+    async def _next(self):
+        """Следующий запрос: голова очереди первого по кругу пользователя"""
+        async with self._available:
+            while (user_id := self._pick_user()) is None:
+                await self._available.wait()
+            queue = self._queues.pop(user_id)
+            request = queue.popleft()
+            request.position = 0
+            self._size -= 1
+            metrics.set("queue_depth", self._size, "Запросы, ожидающие обработки")
+            metrics.observe("queue_wait_seconds", time.monotonic() - request.enqueued_at, "Ожидание в очереди")
+            self._active_users.add(user_id)
+            # Пользователь уходит в конец круга, если у него остались запросы
+            if queue:
+                self._queues[user_id] = queue
+            return request
+
+    async def _release(self, user_id):
+        """Пользователь снова может получить обработчик"""
+        async with self._available:
+            self._active_users.discard(user_id)
+            self._available.notify_all()
+
+    def _refresh_positions(self):
+        """Пересчет позиций ожидающих запросов и уведомление об изменениях"""
+        if not self.on_position_change:
+            return
+        for queue in self._queues.values():
+            for request in queue:
+                position = self._position(request)
+                if position != request.position:
+                    request.position = position
+                    task = asyncio.create_task(self._notify(request))
+                    self._notify_tasks.add(task)
+                    task.add_done_callback(self._notify_tasks.discard)
+
+    async def _notify(self, request):
+        try:
+            await self.on_position_change(request)
+        except Exception as e:
+            self.logger.warning(f"Не удалось обновить позицию в очереди: {e}")
+
+    async def _worker(self, index):
+        while True:
+            request = await self._next()
+            self._refresh_positions()
+            self.in_progress += 1
+            try:
+                await self.handler(request)
+            except Exception as e:
+                self.logger.error(f"Обработчик #{index}: ошибка при обработке запроса: {e}")
+            finally:
+                self.in_progress -= 1
+                await self._release(request.user_id)
@@ -0,0 +1,70 @@
+import logging
+import os
+import sqlite3
+import time
+
+class RequestStore:
+    """Журнал принятых запросов, переживающий перезапуск бота.
+
+    Запрос записывается при получении и удаляется только после того, как
+    ответ (или сообщение об ошибке) доставлен в Telegram. Запросы, оставшиеся
+    в журнале после остановки или падения, повторяются при следующем запуске.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS requests (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                chat_type TEXT NOT NULL,
+                message_id INTEGER NOT NULL,
+                processing_message_id INTEGER NOT NULL,
+                prompt TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def add(self, user_id, chat_id, chat_type, message_id, processing_message_id, prompt):
+        """Запись нового запроса; возвращает его id"""
+        now = time.time()
+        cursor = self.conn.execute(
+            "INSERT INTO requests (user_id, chat_id, chat_type, message_id, processing_message_id, prompt, "
+            "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, chat_id, chat_type, message_id, processing_message_id, prompt, now, now)
+        )
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def start(self, request_id):
+        """Запрос взят в обработку: увеличиваем число попыток"""
+        self.conn.execute(
+            "UPDATE requests SET state = 'in_progress', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+            (time.time(), request_id)
+        )
+        self.conn.commit()
+
+    def ack(self, request_id):
+        """Ответ доставлен - запрос больше не нужен"""
+        self.conn.execute("DELETE FROM requests WHERE id = ?", (request_id,))
+        self.conn.commit()
+
+    def unfinished(self):
+        """Недоставленные запросы в порядке поступления"""
+        return self.conn.execute("SELECT * FROM requests ORDER BY id").fetchall()
+
+    def close(self):
+        self.conn.close()
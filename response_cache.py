@@ -0,0 +1,100 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import time
+
+def normalize_prompt(prompt):
+    """Нормализация запроса: регистр, пробелы и завершающая пунктуация"""
+    text = re.sub(r"\s+", " ", prompt.casefold()).strip()
+    return text.strip(" .!?…")
+
+class ResponseCache:
+    """Кэш ответов ChatGPT на повторяющиеся запросы.
+
+    Применяется только к запросам вне разговора (первое сообщение или первое
+    после /new): в разговоре ответ зависит от контекста. Хранится в SQLite,
+    поэтому переживает перезапуск бота. Записи живут не дольше ttl секунд;
+    при превышении max_bytes вытесняются давно не использованные (LRU).
+    """
+
+    def __init__(self, path, ttl=3600, max_bytes=10 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.logger = logging.getLogger(__name__)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(prompt):
+        """Ключ кэша по нормализованному запросу"""
+        return hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+
+    def get(self, prompt):
+        """Ответ из кэша или None"""
+        key = self.make_key(prompt)
+        now = time.time()
+        row = self.conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row and now - row[1] <= self.ttl:
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+        if row:
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.conn.commit()
+        self.misses += 1
+        return None
+
+    def put(self, prompt, response):
+        """Сохранение ответа в кэш с вытеснением устаревших записей"""
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (self.make_key(prompt), response, size, now, now)
+        )
+        self._evict(now)
+        self.conn.commit()
+
+    def _evict(self, now):
+        """Удаление просроченных записей и LRU-вытеснение сверх лимита размера"""
+        self.conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    def stats(self):
+        """Счетчики попаданий и размер кэша"""
+        entries, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total}
+
+    def close(self):
+        self.conn.close()
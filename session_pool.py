@@ -0,0 +1,210 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from metrics import metrics
+
+class SessionPoolError(Exception):
+    """Нет доступных сессий ChatGPT"""
+
+class SessionPool:
+    """Пул прогретых браузерных сессий ChatGPT.
+
+    Каждая сессия - отдельный AsyncChatGPTClient со своим браузером и файлом
+    cookies. Запросы получают первую свободную сессию; сломанные сессии
+    перезапускаются в фоне, не блокируя остальные. Фоновая проверка
+    периодически опрашивает свободные сессии, заранее продлевает вход и
+    перезапускает сессии, которые не отвечают или заняли слишком много памяти.
+    """
+
+    def __init__(self, client_factory, size=1, acquire_timeout=300, max_restart_delay=120,
+                 health_check_interval=60, refresh_before_expiry=24 * 3600, max_heap_mb=None):
+        self.client_factory = client_factory
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.max_restart_delay = max_restart_delay
+        self.health_check_interval = health_check_interval
+        self.refresh_before_expiry = refresh_before_expiry
+        self.max_heap_mb = max_heap_mb
+        self.sessions = {}
+        self.states = {}
+        # Сессии, последний запуск которых завершился ошибкой
+        self._failing = set()
+        self._idle = asyncio.Queue()
+        self._tasks = set()
+        self._started = False
+        self._closed = False
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        """Запуск всех сессий пула в фоне"""
+        if self._started:
+            return
+        self._started = True
+        for index in range(self.size):
+            self._spawn(self._launch(index))
+        if self.health_check_interval:
+            self._spawn(self._monitor())
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _launch(self, index):
+        """Запуск и авторизация одной сессии с повторными попытками"""
+        delay = 5
+        while not self._closed:
+            self.states[index] = "starting"
+            client = self.client_factory(index)
+            try:
+                await client.setup_driver()
+                if await client.login():
+                    self.sessions[index] = client
+                    self.states[index] = "idle"
+                    self._failing.discard(index)
+                    self._idle.put_nowait(index)
+                    self.logger.info(f"Сессия #{index} готова")
+                    return
+                self.logger.error(f"Сессия #{index}: не удалось войти в ChatGPT")
+            except Exception as e:
+                self.logger.error(f"Сессия #{index}: ошибка запуска: {e}")
+            await self._close_client(client)
+            self.states[index] = "broken"
+            self._failing.add(index)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_restart_delay)
+
+    async def _close_client(self, client):
+        try:
+            await client.close()
+        except Exception as e:
+            self.logger.warning(f"Ошибка при закрытии сессии: {e}")
+
+    async def _recycle(self, index):
+        """Перезапуск сломанной сессии"""
+        self.logger.warning(f"Перезапускаем сессию #{index}")
+        metrics.inc("session_restarts_total", help_text="Перезапуски сломанных сессий")
+        self.states[index] = "broken"
+        client = self.sessions.pop(index, None)
+        if client:
+            await self._close_client(client)
+        await self._launch(index)
+
+    async def _monitor(self):
+        """Периодическая проверка свободных сессий"""
+        while not self._closed:
+            await asyncio.sleep(self.health_check_interval)
+            # Забираем свободные сессии на время проверки, чтобы запросы их не получили
+            indexes = []
+            while not self._idle.empty():
+                indexes.append(self._idle.get_nowait())
+            for index in indexes:
+                self.states[index] = "checking"
+            await asyncio.gather(*(self._check(index) for index in indexes))
+
+    async def _check(self, index):
+        """Проверка одной сессии: продление входа или перезапуск"""
+        client = self.sessions.get(index)
+        healthy = False
+        try:
+            if client is None:
+                raise SessionPoolError("Сессия не запущена")
+            health = await client.probe_health()
+            healthy = health["healthy"]
+            if healthy and self.max_heap_mb and (health["heap_mb"] or 0) > self.max_heap_mb:
+                self.logger.warning(f"Сессия #{index}: страница заняла {health['heap_mb']:.0f} МБ памяти")
+                healthy = False
+            expires_in = health["session_expires_in"]
+            if healthy and expires_in is not None and expires_in < self.refresh_before_expiry:
+                self.logger.info(f"Сессия #{index}: cookies истекают через {expires_in / 3600:.1f} ч, продлеваем")
+                metrics.inc("relogins_total", help_text="Продления входа в ChatGPT")
+                healthy = await client.refresh_session()
+        except Exception as e:
+            self.logger.error(f"Сессия #{index}: ошибка проверки: {e}")
+        if self._closed:
+            return
+        if healthy:
+            self.states[index] = "idle"
+            self._idle.put_nowait(index)
+        else:
+            self.states[index] = "broken"
+            self._spawn(self._recycle(index))
+
+    @asynccontextmanager
+    async def session(self):
+        """Получение свободной сессии на время выполнения запроса"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.acquire_timeout
+        while True:
+            remaining = deadline - loop.time()
+            try:
+                index = await asyncio.wait_for(self._idle.get(), timeout=max(remaining, 0))
+            except asyncio.TimeoutError:
+                raise SessionPoolError("Нет доступных сессий ChatGPT, попробуйте позже")
+            client = self.sessions.get(index)
+            try:
+                healthy = bool(client) and await client.check_health()
+            except Exception as e:
+                # Упавший рабочий процесс (BrokenProcessPool) или браузер: без
+                # перезапуска слот навсегда выпал бы из пула
+                self.logger.error(f"Сессия #{index}: ошибка проверки: {e}")
+                healthy = False
+            if healthy:
+                break
+            self.states[index] = "broken"
+            self._spawn(self._recycle(index))
+
+        self.states[index] = "busy"
+        broken = False
+        try:
+            yield client
+        except Exception:
+            broken = True
+            raise
+        finally:
+            if self._closed:
+                pass
+            elif broken:
+                # Ошибка не всегда означает поломку браузера: перезапуск только
+                # если сессия не прошла проверку
+                self.states[index] = "checking"
+                self._spawn(self._check(index))
+            else:
+                self.states[index] = "idle"
+                self._idle.put_nowait(index)
+
+    @property
+    def readiness(self):
+        """Готовность пула: stopped, warming_up, ready или unavailable"""
+        if not self._started:
+            return "stopped"
+        states = set(self.states.values())
+        if states & {"idle", "busy", "checking"}:
+            return "ready"
+        # Пока хотя бы одна сессия запускается впервые или после исправной
+        # работы, пул прогревается; если все перезапуски подряд неудачны - недоступен
+        if len(self._failing) < self.size:
+            return "warming_up"
+        return "unavailable"
+
+    async def memory_usage(self):
+        """RSS браузера каждой запущенной сессии (МБ)"""
+        sessions = sorted(self.sessions.items())
+        usage = await asyncio.gather(*(client.memory_usage() for _, client in sessions))
+        return {index: mb for (index, _), mb in zip(sessions, usage) if mb is not None}
+
+    def stats(self):
+        """Количество сессий в каждом состоянии"""
+        counts = {}
+        for state in self.states.values():
+            counts[state] = counts.get(state, 0) + 1
+        return counts
+
+    async def close(self):
+        """Остановка пула и закрытие всех браузеров"""
+        self._closed = True
+        for task in list(self._tasks):
+            task.cancel()
+        sessions, self.sessions = list(self.sessions.values()), {}
+        await asyncio.gather(*(self._close_client(client) for client in sessions))
@@ -0,0 +1,40 @@
+import asyncio
+from metrics import metrics
+
+class SingleFlight:
+    """Объединение одинаковых одновременных запросов к ChatGPT.
+
+    Первый запрос с данным ключом становится ведущим и идет в браузер;
+    такие же запросы, пришедшие до его завершения, ждут результат ведущего
+    вместо отдельной генерации.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.saved = 0
+
+    def lead(self, key):
+        """True, если запрос стал ведущим, False - если такой же уже выполняется"""
+        if key in self._flights:
+            return False
+        self._flights[key] = asyncio.get_running_loop().create_future()
+        return True
+
+    async def wait(self, key):
+        """Результат ведущего запроса; None, если он завершился неудачей"""
+        # shield: отмена одного ожидающего не должна отменять результат для остальных
+        result = await asyncio.shield(self._flights[key])
+        # После неудачи ведущего ожидающий сам идет в браузер - экономии нет
+        if result is not None:
+            self.saved += 1
+            metrics.inc("coalesced_requests_total", help_text="Обращения к браузеру, сэкономленные объединением запросов")
+        return result
+
+    def finish(self, key, result=None):
+        """Завершение ведущего запроса и передача результата ожидающим"""
+        future = self._flights.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def __len__(self):
+        return len(self._flights)
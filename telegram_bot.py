@@ -1,10 +1,31 @@
 import os
+import json
 import logging
 import asyncio
-from telegram import Update
+import tempfile
+import secrets
+import time
+from concurrent.futures import BrokenExecutor
+from datetime import datetime, timezone
+from selenium.common.exceptions import WebDriverException
+from urllib3.exceptions import HTTPError as DriverConnectionError
+from telegram import Chat, Message, Update
+from telegram.error import TelegramError
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from dotenv import load_dotenv
-from chatgpt_client import ChatGPTClient
+from async_client import AsyncChatGPTClient
+from cdp_client import CDPChatGPTClient, CDPError
+from chatgpt_client import RateLimitError, ResponseError
+from session_pool import SessionPool, SessionPoolError
+from account_router import AccountRouter, AccountShard, account_id
+from response_cache import ResponseCache
+from history_store import HistoryStore
+from metrics import metrics, start_metrics_server
+from request_scheduler import RequestScheduler, ChatRequest, QueueFullError
+from single_flight import SingleFlight
+from request_store import RequestStore
+from user_limits import UserLimits, UsageStats, LimitExceededError
+from telegram_utils import StreamingReply, send_response
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -16,22 +37,203 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Сбои браузера и сессии до отправки запроса, после которых он повторяется в
+# другой сессии: переход в разговор, поиск поля ввода, упавший chromedriver
+# или рабочий процесс. Сбои после отправки клиенты выдают как ResponseError,
+# ошибки Telegram тоже не повторяются - иначе вопрос попал бы в ChatGPT дважды
+BROWSER_ERRORS = (WebDriverException, CDPError, DriverConnectionError, BrokenExecutor, OSError, asyncio.TimeoutError)
+
 class TelegramBot:
     def __init__(self):
         self.token = os.getenv('TELEGRAM_BOT_TOKEN')
         self.chatgpt_email = os.getenv('CHATGPT_EMAIL')
         self.chatgpt_password = os.getenv('CHATGPT_PASSWORD')
+        self.chatgpt_base_url = os.getenv('CHATGPT_BASE_URL', 'https://chat.openai.com')
         self.headless_mode = os.getenv('HEADLESS_MODE', 'true').lower() == 'true'
         self.browser_timeout = int(os.getenv('BROWSER_TIMEOUT', '30'))
+        self.response_timeout = int(os.getenv('RESPONSE_TIMEOUT', '180'))
+        self.response_stable_seconds = float(os.getenv('RESPONSE_STABLE_SECONDS', '1.0'))
+        self.prompt_input_mode = os.getenv('PROMPT_INPUT_MODE', 'insert').lower()
+        self.stream_responses = os.getenv('STREAM_RESPONSES', 'true').lower() == 'true'
+        self.stream_edit_interval = float(os.getenv('STREAM_EDIT_INTERVAL', '1.5'))
+        self.response_file_threshold = int(os.getenv('RESPONSE_FILE_THRESHOLD', '12000'))
+        self.pool_size = int(os.getenv('BROWSER_POOL_SIZE', '1'))
+        # Несколько аккаунтов ChatGPT: JSON-файл [{"email": ..., "password": ...}]
+        self.accounts_file = os.getenv('CHATGPT_ACCOUNTS_FILE')
+        self.account_cooldown = int(os.getenv('ACCOUNT_COOLDOWN', '3600'))
+        # Каждая сессия в своем рабочем процессе
+        self.worker_processes = os.getenv('WORKER_PROCESSES', 'false').lower() == 'true'
+        # Управление браузером: selenium (chromedriver) или cdp (DevTools Protocol напрямую)
+        self.browser_backend = os.getenv('BROWSER_BACKEND', 'selenium').lower()
+        if self.browser_backend not in ("selenium", "cdp"):
+            raise ValueError(f"Неизвестный BROWSER_BACKEND: {self.browser_backend}. Допустимые: selenium, cdp")
+        self.session_data_dir = os.getenv('SESSION_DATA_DIR', 'sessions')
+        self.persistent_profiles = os.getenv('PERSISTENT_PROFILES', 'false').lower() == 'true'
+        self.lean_mode = os.getenv('LEAN_MODE', 'false').lower() == 'true'
+        self.reload_every_messages = int(os.getenv('RELOAD_EVERY_MESSAGES', '0'))
+        self.health_check_interval = int(os.getenv('HEALTH_CHECK_INTERVAL', '60'))
+        self.session_refresh_before_expiry = int(os.getenv('SESSION_REFRESH_BEFORE_EXPIRY', str(24 * 3600)))
+        self.max_page_heap_mb = int(os.getenv('MAX_PAGE_HEAP_MB', '0')) or None
+        self.request_retries = int(os.getenv('REQUEST_RETRIES', '2'))
+        # Сколько раз повторять после перезапуска запрос, на котором бот останавливался
+        self.request_max_attempts = int(os.getenv('REQUEST_MAX_ATTEMPTS', '3'))
+        self.response_cache_enabled = os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() == 'true'
+        self.response_cache_ttl = int(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+        self.response_cache_max_bytes = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(10 * 1024 * 1024)))
+        self.history_max_bytes = int(os.getenv('HISTORY_MAX_BYTES', str(5 * 1024 * 1024)))
+        self.history_backups = int(os.getenv('HISTORY_BACKUPS', '3'))
+        self.history_buffer_size = int(os.getenv('HISTORY_BUFFER_SIZE', '100'))
+        self.metrics_host = os.getenv('METRICS_HOST', '127.0.0.1')
+        self.metrics_port = int(os.getenv('METRICS_PORT', '0'))
+        self.admin_user_ids = {int(x) for x in os.getenv('ADMIN_USER_IDS', '').split(',') if x.strip()}
+        self.max_queue_size = int(os.getenv('MAX_QUEUE_SIZE', '50'))
+        self.max_queue_per_user = int(os.getenv('MAX_QUEUE_PER_USER', '3'))
+        self.user_messages_per_minute = int(os.getenv('USER_MESSAGES_PER_MINUTE', '6'))
+        self.user_chars_per_hour = int(os.getenv('USER_CHARS_PER_HOUR', '50000'))
+        self.chat_messages_per_minute = int(os.getenv('CHAT_MESSAGES_PER_MINUTE', '20'))
+        self.chat_chars_per_hour = int(os.getenv('CHAT_CHARS_PER_HOUR', '200000'))
+        # Webhook вместо long polling, если задан публичный адрес
+        self.webhook_url = os.getenv('WEBHOOK_URL', '')
+        self.webhook_listen = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+        self.webhook_port = int(os.getenv('WEBHOOK_PORT', '8443'))
+        self.webhook_path = os.getenv('WEBHOOK_PATH', 'telegram').strip('/')
+        # Без заданного секрета генерируем случайный: Telegram передает его
+        # в заголовке каждого запроса, чужие запросы отклоняются
+        self.webhook_secret = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
         
         if not self.token:
             raise ValueError("TELEGRAM_BOT_TOKEN не найден в переменных окружения")
-        if not self.chatgpt_email or not self.chatgpt_password:
-            raise ValueError("CHATGPT_EMAIL и CHATGPT_PASSWORD должны быть указаны в переменных окружения")
+        self.accounts = self.load_accounts()
+        if not self.accounts:
+            raise ValueError("CHATGPT_EMAIL и CHATGPT_PASSWORD (или CHATGPT_ACCOUNTS_FILE) должны быть указаны в переменных окружения")
         
-        self.chatgpt_client = None
+        # У каждого аккаунта свой пул сессий; пользователи распределяются
+        # по аккаунтам маршрутизатором
+        shards = []
+        for account in self.accounts:
+            pool = SessionPool(
+                lambda index, account=account: self.create_client(account, index),
+                size=self.pool_size,
+                health_check_interval=self.health_check_interval,
+                refresh_before_expiry=self.session_refresh_before_expiry,
+                max_heap_mb=self.max_page_heap_mb
+            )
+            shards.append(AccountShard(account["id"], pool))
+        self.router = AccountRouter(shards, cooldown=self.account_cooldown)
+        # user_id -> URL разговора ChatGPT этого пользователя
+        self.conversations_path = os.path.join(self.session_data_dir, "conversations.json")
+        self.conversations = self.load_conversations()
+        self.history = HistoryStore(
+            os.path.join(self.session_data_dir, "history.jsonl"),
+            max_bytes=self.history_max_bytes,
+            backups=self.history_backups
+        )
+        self.response_cache = None
+        if self.response_cache_enabled:
+            self.response_cache = ResponseCache(
+                os.path.join(self.session_data_dir, "response_cache.sqlite3"),
+                ttl=self.response_cache_ttl,
+                max_bytes=self.response_cache_max_bytes
+            )
+        # Принятые запросы хранятся до доставки ответа и повторяются после перезапуска
+        self.request_store = RequestStore(os.path.join(self.session_data_dir, "requests.sqlite3"))
+        self.user_limits = UserLimits(
+            user_messages_per_minute=self.user_messages_per_minute,
+            user_chars_per_hour=self.user_chars_per_hour,
+            chat_messages_per_minute=self.chat_messages_per_minute,
+            chat_chars_per_hour=self.chat_chars_per_hour
+        )
+        self.usage = UsageStats()
+        # Одинаковые одновременные запросы вне разговора идут в браузер один раз
+        self.single_flight = SingleFlight()
+        # По одному обработчику очереди на каждую сессию браузера
+        self.scheduler = RequestScheduler(
+            self.process_request,
+            workers=self.pool_size * len(self.accounts),
+            max_queue_size=self.max_queue_size,
+            max_per_user=self.max_queue_per_user,
+            on_position_change=self.show_queue_position
+        )
         self.application = None
+        self.metrics_server = None
+    
+    def load_accounts(self):
+        """Аккаунты ChatGPT из CHATGPT_ACCOUNTS_FILE или из CHATGPT_EMAIL/CHATGPT_PASSWORD"""
+        if self.accounts_file:
+            with open(self.accounts_file, "r", encoding="utf-8") as f:
+                credentials = [(item["email"], item["password"]) for item in json.load(f)]
+        elif self.chatgpt_email and self.chatgpt_password:
+            credentials = [(self.chatgpt_email, self.chatgpt_password)]
+        else:
+            return []
+        accounts = []
+        for email, password in credentials:
+            shard_id = account_id(email)
+            # С одним аккаунтом данные лежат прямо в SESSION_DATA_DIR, как раньше
+            data_dir = self.session_data_dir
+            if len(credentials) > 1:
+                data_dir = os.path.join(self.session_data_dir, f"account_{shard_id}")
+            accounts.append({"id": shard_id, "email": email, "password": password, "data_dir": data_dir})
+        return accounts
+    
+    def create_client(self, account, index):
+        """Создание клиента ChatGPT для сессии пула аккаунта с отдельным файлом cookies"""
+        data_dir = account["data_dir"]
+        os.makedirs(data_dir, exist_ok=True)
+        client_kwargs = dict(
+            email=account["email"],
+            password=account["password"],
+            headless=self.headless_mode,
+            timeout=self.browser_timeout,
+            base_url=self.chatgpt_base_url,
+            history_size=self.history_buffer_size,
+            lean_mode=self.lean_mode,
+            reload_every=self.reload_every_messages,
+            response_timeout=self.response_timeout,
+            response_stable_seconds=self.response_stable_seconds,
+            input_mode=self.prompt_input_mode,
+            cookie_path=os.path.join(data_dir, f"cookies_{index}.json"),
+            discovery_cache_path=os.path.join(self.session_data_dir, "driver_cache.json"),
+            profile_dir=os.path.join(data_dir, f"profile_{index}") if self.persistent_profiles else None
+        )
+        if self.browser_backend == "cdp":
+            return CDPChatGPTClient(**client_kwargs)
+        return AsyncChatGPTClient(process=self.worker_processes, **client_kwargs)
         
+    def load_conversations(self):
+        """Загрузка привязки пользователей к разговорам ChatGPT"""
+        if not os.path.exists(self.conversations_path):
+            return {}
+        try:
+            with open(self.conversations_path, "r", encoding="utf-8") as f:
+                conversations = json.load(f)
+            # Старый формат без аккаунта: разговоры принадлежат первому аккаунту
+            return {
+                int(user_id): entry if isinstance(entry, dict) else {"account": self.accounts[0]["id"], "url": entry}
+                for user_id, entry in conversations.items()
+            }
+        except Exception as e:
+            logger.warning(f"Ошибка при загрузке разговоров: {e}")
+            return {}
+    
+    def conversation_for(self, user_id, shard):
+        """URL разговора пользователя, если он ведется в аккаунте shard"""
+        entry = self.conversations.get(user_id)
+        if entry and entry["account"] == shard.account_id:
+            return entry["url"]
+        return None
+    
+    def save_conversations(self):
+        """Сохранение привязки пользователей к разговорам ChatGPT"""
+        try:
+            os.makedirs(self.session_data_dir, exist_ok=True)
+            tmp_path = f"{self.conversations_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.conversations, f)
+            os.replace(tmp_path, self.conversations_path)
+        except Exception as e:
+            logger.warning(f"Ошибка при сохранении разговоров: {e}")
+    
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         welcome_message = """
@@ -63,6 +265,8 @@ class TelegramBot:
 /start - Начать работу с ботом
 /help - Показать эту справку
 /status - Проверить статус подключения к ChatGPT
+/new - Начать новый разговор с ChatGPT
+/history - Получить историю ваших вопросов и ответов файлом
 
 ⚠️ Ограничения:
 • Бот работает только с текстовыми сообщениями
@@ -76,13 +280,76 @@ class TelegramBot:
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /status"""
         try:
-            if self.chatgpt_client and self.chatgpt_client.driver:
-                await update.message.reply_text("✅ Бот подключен к ChatGPT и готов к работе!")
+            stats = self.router.stats()
+            sessions = (
+                f"Сессии: свободно {stats.get('idle', 0)}, занято {stats.get('busy', 0)}, "
+                f"проверяется {stats.get('checking', 0)}, запускается {stats.get('starting', 0)}, "
+                f"сломано {stats.get('broken', 0)}\n"
+                f"Очередь: {self.scheduler.size}, объединено одинаковых запросов: {self.single_flight.saved}"
+            )
+            if len(self.accounts) > 1:
+                sessions += f"\nАккаунты: {len(self.accounts)}, на паузе из-за лимитов: {self.router.cooling}"
+            memory = await self.router.memory_usage()
+            if memory:
+                sessions += "\nПамять: " + ", ".join(f"#{index} {mb:.0f} МБ" for index, mb in memory.items())
+            if self.response_cache:
+                cache = self.response_cache.stats()
+                sessions += (
+                    f"\nКэш: попаданий {cache['hits']}, промахов {cache['misses']}, "
+                    f"записей {cache['entries']} ({cache['bytes'] // 1024} КБ)"
+                )
+            readiness = self.router.readiness
+            if readiness == "ready":
+                await update.message.reply_text(f"✅ Бот подключен к ChatGPT и готов к работе!\n{sessions}")
+            elif readiness == "warming_up":
+                await update.message.reply_text(f"⏳ Браузер запускается и входит в ChatGPT. Сообщения будут обработаны после запуска.\n{sessions}")
             else:
-                await update.message.reply_text("❌ Бот не подключен к ChatGPT. Попробуйте отправить сообщение для автоматического подключения.")
+                await update.message.reply_text(f"❌ Бот не подключен к ChatGPT. Сессии перезапускаются автоматически.\n{sessions}")
         except Exception as e:
             await update.message.reply_text(f"❌ Ошибка при проверке статуса: {str(e)}")
     
+    async def new_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /new"""
+        if self.conversations.pop(update.effective_user.id, None):
+            self.save_conversations()
+        await update.message.reply_text("🆕 Начат новый разговор. Следующее сообщение откроет новую ветку в ChatGPT.")
+    
+    async def history_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /history"""
+        user_id = update.effective_user.id
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "chat_history.txt")
+            count = await asyncio.to_thread(self.history.export, filename, user_id)
+            if not count:
+                await update.message.reply_text("📭 История пуста")
+                return
+            with open(filename, "rb") as f:
+                await update.message.reply_document(f, filename="chat_history.txt", caption=f"📜 Записей: {count}")
+    
+    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /stats (только для администраторов)"""
+        if update.effective_user.id not in self.admin_user_ids:
+            await update.message.reply_text("⛔ Команда доступна только администраторам")
+            return
+        summary = metrics.summary()
+        await update.message.reply_text(f"📊 Статистика:\n{summary}" if summary else "📊 Статистика пока пуста")
+    
+    async def usage_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /usage: потребление по пользователям (только для администраторов)"""
+        if update.effective_user.id not in self.admin_user_ids:
+            await update.message.reply_text("⛔ Команда доступна только администраторам")
+            return
+        top = self.usage.top()
+        if not top:
+            await update.message.reply_text("📈 Запросов пока не было")
+            return
+        lines = [
+            f"{user_id}: {usage['messages']} сообщ., {usage['prompt_chars']} симв. запросов, "
+            f"{usage['response_chars']} симв. ответов, браузер {usage['browser_seconds']:.0f} с"
+            for user_id, usage in top
+        ]
+        await update.message.reply_text("📈 Потребление с момента запуска:\n" + "\n".join(lines))
+    
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик текстовых сообщений"""
         user_message = update.message.text
@@ -90,56 +357,248 @@ class TelegramBot:
         
         logger.info(f"Получено сообщение от пользователя {user_id}: {user_message[:50]}...")
         
+        # Лимиты проверяются до любой работы с кэшем и браузером; администраторы без лимитов
+        if user_id not in self.admin_user_ids:
+            try:
+                self.user_limits.check(user_id, update.effective_chat.id, len(user_message))
+            except LimitExceededError as e:
+                await update.message.reply_text(f"🚦 {e}")
+                return
+        self.usage.record_request(user_id, user_message)
+        
+        # Повторяющиеся запросы отдаем из кэша без обращения к браузеру.
+        # Кэш применим только вне разговора: в разговоре ответ зависит от контекста
+        if self.response_cache and user_id not in self.conversations:
+            cached = self.response_cache.get(user_message)
+            metrics.inc("cache_hits_total" if cached else "cache_misses_total",
+                        help_text="Обращения к кэшу ответов")
+            if cached:
+                self.history.append(user_message, cached, user_id)
+                await send_response(None, update.message, cached,
+                                    document_threshold=self.response_file_threshold)
+                return
+        
         # Отправляем сообщение о том, что обрабатываем запрос
         processing_message = await update.message.reply_text("🤔 Обрабатываю ваш запрос...")
+        request_id = self.request_store.add(
+            user_id, update.effective_chat.id, update.effective_chat.type,
+            update.message.message_id, processing_message.message_id, user_message
+        )
         
-        try:
-            # Инициализируем ChatGPT клиент, если он еще не создан
-            if not self.chatgpt_client:
-                await update.message.reply_text("🔗 Подключаюсь к ChatGPT...")
-                self.chatgpt_client = ChatGPTClient(
-                    email=self.chatgpt_email,
-                    password=self.chatgpt_password,
-                    headless=self.headless_mode,
-                    timeout=self.browser_timeout
-                )
-                
-                # Настраиваем драйвер и входим в систему
-                self.chatgpt_client.setup_driver()
-                if not self.chatgpt_client.login():
-                    await processing_message.edit_text("❌ Не удалось войти в ChatGPT. Проверьте логин и пароль.")
+        # Такой же запрос вне разговора уже генерируется - ждем его ответ.
+        # Если ведущий запрос не удался, отправляем свой как обычно
+        flight_key = None
+        if user_id not in self.conversations:
+            flight_key = ResponseCache.make_key(user_message)
+            if not self.single_flight.lead(flight_key):
+                result = await self.single_flight.wait(flight_key)
+                if result:
+                    response, html = result
+                    self.history.append(user_message, response, user_id)
+                    await send_response(processing_message, update.message, response, html,
+                                        document_threshold=self.response_file_threshold)
+                    self.request_store.ack(request_id)
                     return
+                flight_key = None
+        
+        request = ChatRequest(
+            user_id=user_id,
+            chat_id=update.effective_chat.id,
+            prompt=user_message,
+            processing_message=processing_message,
+            reply_to=update.message,
+            flight_key=flight_key,
+            request_id=request_id
+        )
+        try:
+            position = await self.scheduler.submit(request)
+        except QueueFullError as e:
+            if flight_key:
+                self.single_flight.finish(flight_key)
+            self.request_store.ack(request_id)
+            await processing_message.edit_text(f"🚦 {e}")
+            return
+        
+        if position > 1:
+            await self.show_queue_position(request)
+    
+    async def show_queue_position(self, request):
+        """Обновление позиции запроса в очереди в сообщении пользователя"""
+        # Позиция 0 - запрос уже взят в обработку
+        if not request.position:
+            return
+        await request.processing_message.edit_text(f"⏳ Вы #{request.position} в очереди...")
+    
+    async def process_request(self, request):
+        """Обработка запроса из очереди в свободной сессии ChatGPT"""
+        processing_message = request.processing_message
+        result = None
+        if request.request_id:
+            self.request_store.start(request.request_id)
+        try:
+            # Во время прогрева запрос ждет первую готовую сессию
+            if self.router.readiness != "ready":
+                await processing_message.edit_text("⏳ Браузер запускается, ваш запрос в очереди...")
             
-            # Отправляем сообщение в ChatGPT
-            await processing_message.edit_text("💬 Отправляю запрос в ChatGPT...")
-            response = self.chatgpt_client.send_message(user_message)
+            # Сбой сессии не виден пользователю: запрос повторяется в другой сессии,
+            # а сломанная перезапускается пулом в фоне
+            for attempt in range(1, self.request_retries + 2):
+                # Аккаунт выбирается заново на каждой попытке: после лимита
+                # или гибели аккаунта запрос уходит на следующий
+                shard = self.router.route(request.user_id)
+                conversation_url = self.conversation_for(request.user_id, shard)
+                try:
+                    response, html = await self.ask_chatgpt(request, shard, conversation_url)
+                    break
+                except (SessionPoolError, ResponseError):
+                    raise
+                except RateLimitError as e:
+                    self.router.cool_down(shard)
+                    if attempt > self.request_retries:
+                        raise
+                    logger.warning(f"Аккаунт {shard.account_id} достиг лимита: {e}. Повторяем в другом аккаунте")
+                    metrics.inc("retries_total", help_text="Повторы запроса после сбоя сессии")
+                    await processing_message.edit_text("🔄 Лимит аккаунта ChatGPT, повторяем запрос...")
+                except BROWSER_ERRORS as e:
+                    if attempt > self.request_retries:
+                        raise
+                    logger.warning(f"Попытка {attempt} не удалась: {e}. Повторяем в другой сессии")
+                    metrics.inc("retries_total", help_text="Повторы запроса после сбоя сессии")
+                    await processing_message.edit_text("🔄 Сбой сессии ChatGPT, повторяем запрос...")
             
-            # Отправляем ответ пользователю
-            if response:
-                # Разбиваем длинные ответы на части (Telegram ограничение 4096 символов)
-                if len(response) > 4000:
-                    chunks = [response[i:i+4000] for i in range(0, len(response), 4000)]
-                    for i, chunk in enumerate(chunks):
-                        if i == 0:
-                            await processing_message.edit_text(chunk)
-                        else:
-                            await update.message.reply_text(chunk)
-                else:
-                    await processing_message.edit_text(response)
-            else:
+            if not response:
                 await processing_message.edit_text("❌ Не удалось получить ответ от ChatGPT")
+                self.ack_request(request)
+                return
+            # Ответ уже доставлен в Telegram
+            self.ack_request(request)
+            self.usage.record_response(request.user_id, response)
+            self.history.append(request.prompt, response, request.user_id)
+            if not conversation_url:
+                result = (response, html)
+                if self.response_cache:
+                    self.response_cache.put(request.prompt, response)
                 
         except Exception as e:
             logger.error(f"Ошибка при обработке сообщения: {e}")
-            await processing_message.edit_text(f"❌ Произошла ошибка: {str(e)}")
-            
-            # Пытаемся переподключиться к ChatGPT
+            metrics.inc("errors_total", help_text="Запросы, завершившиеся ошибкой")
+            self.ack_request(request)
+            try:
+                await processing_message.edit_text(f"❌ Произошла ошибка: {str(e)}")
+            except TelegramError as edit_error:
+                # Ошибкой могла быть сама доставка: сообщение удалено или чат недоступен
+                logger.warning(f"Не удалось сообщить об ошибке: {edit_error}")
+        finally:
+            # При остановке бота (отмена) запрос не подтверждается и будет повторен
+            # Ответ в разговоре зависит от контекста и ожидающим не подходит
+            if request.flight_key:
+                self.single_flight.finish(request.flight_key, result)
+    
+    def ack_request(self, request):
+        """Удаление запроса из журнала после доставки ответа"""
+        if request.request_id:
+            self.request_store.ack(request.request_id)
+    
+    def restore_message(self, bot, chat_id, chat_type, message_id):
+        """Сообщение Telegram по сохраненным идентификаторам, пригодное для edit_text и reply_text"""
+        message = Message(message_id, datetime.now(timezone.utc), Chat(chat_id, chat_type))
+        message.set_bot(bot)
+        return message
+    
+    async def replay_requests(self, bot):
+        """Повтор запросов, не получивших ответ до остановки бота"""
+        rows = self.request_store.unfinished()
+        if rows:
+            logger.info(f"Повторяем {len(rows)} запросов, оставшихся без ответа")
+        for row in rows:
+            processing_message = self.restore_message(bot, row["chat_id"], row["chat_type"], row["processing_message_id"])
+            request = ChatRequest(
+                user_id=row["user_id"],
+                chat_id=row["chat_id"],
+                prompt=row["prompt"],
+                processing_message=processing_message,
+                reply_to=self.restore_message(bot, row["chat_id"], row["chat_type"], row["message_id"]),
+                request_id=row["id"]
+            )
             try:
-                if self.chatgpt_client:
-                    self.chatgpt_client.close()
-                self.chatgpt_client = None
-            except:
-                pass
+                # Запрос, на котором бот падал уже несколько раз, не повторяем
+                if row["attempts"] >= self.request_max_attempts:
+                    self.request_store.ack(row["id"])
+                    await processing_message.edit_text("❌ Не удалось обработать запрос. Отправьте его еще раз")
+                    continue
+                await processing_message.edit_text("🔁 Бот перезапущен, ваш запрос снова в очереди...")
+                await self.scheduler.submit(request)
+                metrics.inc("requests_replayed_total", help_text="Запросы, повторенные после перезапуска")
+            except QueueFullError as e:
+                self.request_store.ack(row["id"])
+                await processing_message.edit_text(f"🚦 {e}")
+            except Exception as e:
+                # Сообщение удалено или чат недоступен - отвечать некуда
+                logger.warning(f"Не удалось повторить запрос {row['id']}: {e}")
+                self.request_store.ack(row["id"])
+    
+    async def ask_chatgpt(self, request, shard, conversation_url):
+        """Один запрос в первой свободной сессии аккаунта shard, в разговоре пользователя;
+        возвращает текст и HTML-разметку ответа"""
+        processing_message = request.processing_message
+        delivery_error = None
+        async with shard.pool.session() as client:
+            started = time.monotonic()
+            try:
+                await processing_message.edit_text("💬 Отправляю запрос в ChatGPT...")
+                reply = None
+                if self.stream_responses:
+                    response, html, reply = await self.stream_response(client, request.prompt, processing_message,
+                                                                       request.reply_to, conversation_url)
+                else:
+                    # Пустой ответ не повторяется: запрос уже отправлен (см. process_request)
+                    response = ""
+                    async for response in client.stream_message(request.prompt, conversation_url):
+                        pass
+                    html = await client.last_response_html() if response else None
+            
+                # Новый разговор получает свой URL после первого ответа
+                new_url = await client.conversation_url()
+                if new_url and new_url != conversation_url:
+                    self.conversations[request.user_id] = {"account": shard.account_id, "url": new_url}
+                    self.save_conversations()
+                
+                if response and reply:
+                    await reply.finish(response, html)
+                elif response:
+                    await send_response(processing_message, request.reply_to, response, html,
+                                        document_threshold=self.response_file_threshold)
+            except TelegramError as e:
+                # Ответ получен, но не доставлен: сессия исправна, а повтор
+                # добавил бы в разговор ChatGPT тот же вопрос еще раз
+                delivery_error = e
+            finally:
+                self.usage.record_browser_time(request.user_id, time.monotonic() - started)
+        if delivery_error:
+            raise delivery_error
+        return response, html
+    
+    async def stream_response(self, client, user_message, processing_message, reply_to, conversation_url=None):
+        """Потоковый показ ответа правками сообщения по мере генерации; возвращает
+        текст, HTML-разметку и StreamingReply для финальной доставки"""
+        reply = StreamingReply(processing_message, reply_to, min_interval=self.stream_edit_interval,
+                               document_threshold=self.response_file_threshold)
+        response = ""
+        html = None
+        try:
+            async for response in client.stream_message(user_message, conversation_url):
+                try:
+                    await reply.update(response)
+                except TelegramError as e:
+                    # Промежуточные правки необязательны; генерацию дочитываем до конца
+                    logger.warning(f"Не удалось обновить ответ в Telegram: {e}")
+        except Exception:
+            # Повторная попытка начнет показ заново с первого сообщения
+            await reply.discard()
+            raise
+        if response:
+            html = await client.last_response_html()
+        return response, html, reply
     
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик ошибок"""
@@ -147,30 +606,72 @@ class TelegramBot:
         if update and update.effective_message:
             await update.effective_message.reply_text("❌ Произошла ошибка в работе бота. Попробуйте позже.")
     
+    async def post_init(self, application: Application):
+        """Прогрев браузеров и вход в ChatGPT до начала получения обновлений"""
+        logger.info(f"Запускаем {self.pool_size} сессий ChatGPT для {len(self.accounts)} аккаунтов...")
+        self.router.start()
+        self.scheduler.start()
+        await self.replay_requests(application.bot)
+        if self.metrics_port:
+            self.metrics_server = await start_metrics_server(self.metrics_host, self.metrics_port)
+    
+    async def post_shutdown(self, application: Application):
+        """Закрытие браузеров при остановке приложения"""
+        await self.scheduler.stop()
+        await self.router.close()
+        if self.metrics_server:
+            self.metrics_server.close()
+        if self.response_cache:
+            self.response_cache.close()
+        self.request_store.close()
+    
     def run(self):
         """Запуск бота"""
         try:
             # Создаем приложение
-            self.application = Application.builder().token(self.token).build()
+            # concurrent_updates позволяет обрабатывать /status, /help и сообщения
+            # других пользователей, пока браузер занят генерацией ответа
+            self.application = (
+                Application.builder()
+                .token(self.token)
+                .concurrent_updates(True)
+                .post_init(self.post_init)
+                .post_shutdown(self.post_shutdown)
+                .build()
+            )
             
             # Добавляем обработчики
             self.application.add_handler(CommandHandler("start", self.start_command))
             self.application.add_handler(CommandHandler("help", self.help_command))
             self.application.add_handler(CommandHandler("status", self.status_command))
+            self.application.add_handler(CommandHandler("new", self.new_command))
+            self.application.add_handler(CommandHandler("history", self.history_command))
+            self.application.add_handler(CommandHandler("stats", self.stats_command))
+            self.application.add_handler(CommandHandler("usage", self.usage_command))
             self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
             
             # Добавляем обработчик ошибок
             self.application.add_error_handler(self.error_handler)
             
-            logger.info("Бот запущен...")
-            self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+            # Обработчики используют только сообщения, остальные типы
+            # обновлений не запрашиваем
+            allowed_updates = [Update.MESSAGE]
+            if self.webhook_url:
+                logger.info(f"Бот запущен в режиме webhook на {self.webhook_listen}:{self.webhook_port}...")
+                self.application.run_webhook(
+                    listen=self.webhook_listen,
+                    port=self.webhook_port,
+                    url_path=self.webhook_path,
+                    webhook_url=f"{self.webhook_url.rstrip('/')}/{self.webhook_path}",
+                    secret_token=self.webhook_secret,
+                    allowed_updates=allowed_updates
+                )
+            else:
+                logger.info("Бот запущен...")
+                self.application.run_polling(allowed_updates=allowed_updates)
             
         except Exception as e:
             logger.error(f"Ошибка при запуске бота: {e}")
-        finally:
-            # Закрываем браузер при завершении
-            if self.chatgpt_client:
-                self.chatgpt_client.close()
 
 if __name__ == "__main__":
     bot = TelegramBot()
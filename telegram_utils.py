@@ -0,0 +1,309 @@
+import asyncio
+import io
+import logging
+import re
+from html import unescape
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter, TelegramError
+from metrics import metrics
+
+# Telegram ограничивает сообщение 4096 символами UTF-16 после разбора
+# разметки; оставляем запас под курсор
+MESSAGE_LIMIT = 4000
+STREAM_CURSOR = " ▌"
+# Ответы длиннее этого порога отправляются файлом
+DOCUMENT_THRESHOLD = 12000
+PREVIEW_LENGTH = 600
+
+TAG_RE = re.compile(r"(<[^>]+>)")
+ATOM_RE = re.compile(r"[^\S\n]*\n\n+|[^\S\n]*\n|\S+[^\S\n]*|[^\S\n]+")
+# HTML-сущность или один символ: слово режется только между ними
+CHAR_RE = re.compile(r"&#?\w+;|.", re.DOTALL)
+
+logger = logging.getLogger(__name__)
+
+def utf16_len(text):
+    """Длина в единицах UTF-16, как ее считает Telegram"""
+    return len(text.encode("utf-16-le")) // 2
+
+def visible_len(text, html=False):
+    """Длина текста после разбора HTML-разметки"""
+    if html:
+        text = unescape(TAG_RE.sub("", text))
+    return utf16_len(text)
+
+def _atoms(text, html):
+    """Разбиение на теги и кусочки текста: слова, переводы строк, абзацы"""
+    parts = TAG_RE.split(text) if html else [text]
+    atoms = []
+    for part in parts:
+        if html and TAG_RE.fullmatch(part):
+            atoms.append(part)
+        elif part:
+            atoms.extend(ATOM_RE.findall(part))
+    return atoms
+
+def _tag_name(tag):
+    return tag.strip("</>").split()[0].lower()
+
+def _open_tags_after(atoms, stack):
+    """Стек открытых тегов после atoms"""
+    stack = list(stack)
+    for atom in atoms:
+        if atom.startswith("</"):
+            name = _tag_name(atom)
+            for i in range(len(stack) - 1, -1, -1):
+                if _tag_name(stack[i]) == name:
+                    del stack[i:]
+                    break
+        elif atom.startswith("<") and not atom.endswith("/>"):
+            stack.append(atom)
+    return stack
+
+def _break_index(chunk, sizes, limit, html):
+    """Лучшее место разрыва: конец абзаца, затем строки, затем слова.
+
+    Абзацы и строки используются, только если часть получается заполненной
+    хотя бы наполовину, иначе длинный блок кода уходит целиком в следующее
+    сообщение.
+    """
+    tests = (
+        (lambda a: a.endswith("\n\n"), limit // 2),
+        (lambda a: a.endswith("\n"), limit // 2),
+        (lambda a: a[-1:].isspace(), 0),
+    )
+    for test, min_size in tests:
+        for i in range(len(chunk) - 1, 0, -1):
+            atom = chunk[i - 1]
+            if sizes[i] < min_size:
+                break
+            if not (html and atom.startswith("<")) and test(atom):
+                return i
+    return len(chunk)
+
+def _take(atom, limit, html=False):
+    """Начало слова длиной не больше limit единиц UTF-16; в HTML-режиме
+    сущности вроде &amp; не разрываются"""
+    size = 0
+    for match in (CHAR_RE if html else re.compile(".", re.DOTALL)).finditer(atom):
+        size += visible_len(match.group(), html)
+        if size > limit:
+            # Хотя бы один символ, чтобы разбивка продвигалась
+            return atom[:match.start()] or match.group()
+    return atom
+
+def _has_text(chunk, html):
+    return bool((unescape(TAG_RE.sub("", chunk)) if html else chunk).strip())
+
+def split_text(text, limit=MESSAGE_LIMIT, html=False):
+    """Разбивка текста на сообщения не длиннее limit символов UTF-16.
+
+    Части разрываются по границам абзацев, строк или слов; в HTML-режиме
+    открытые теги (например, <pre> блока кода) закрываются в конце части и
+    открываются заново в начале следующей.
+    """
+    def atom_size(atom):
+        return 0 if html and atom.startswith("<") else visible_len(atom, html)
+
+    atoms = _atoms(text, html)
+    chunks = []
+    stack = []
+    # sizes[i] - длина первых i элементов текущей части
+    current, sizes = [], [0]
+    i = 0
+    while i < len(atoms):
+        atom = atoms[i]
+        size = atom_size(atom)
+        # Часть без видимого текста (пустая или только открывающие теги)
+        # принимает слово в любом случае, иначе теги ушли бы отдельной частью
+        if sizes[-1] + size <= limit or sizes[-1] == 0:
+            if size > limit:
+                # Одно слово длиннее сообщения: режем посимвольно
+                head = _take(atom, limit, html)
+                atoms[i:i + 1] = [head, atom[len(head):]]
+                continue
+            current.append(atom)
+            sizes.append(sizes[-1] + size)
+            i += 1
+            continue
+        cut = _break_index(current, sizes, limit, html)
+        # Открывающие теги в конце части переносятся вместе с текстом, который они оформляют
+        while html and cut > 1 and current[cut - 1].startswith("<") and not current[cut - 1].startswith("</"):
+            cut -= 1
+        head, current = current[:cut], current[cut:]
+        chunks.append(_finish_chunk(stack, head, html))
+        stack = _open_tags_after(head, stack)
+        sizes = [0]
+        for atom in current:
+            sizes.append(sizes[-1] + atom_size(atom))
+    if current or not chunks:
+        chunks.append(_finish_chunk(stack, current, html))
+    return [chunk for chunk in chunks if _has_text(chunk, html)] or [""]
+
+def _finish_chunk(stack, atoms, html):
+    """Сборка части: повторное открытие тегов, текст, закрытие незакрытых тегов"""
+    body = "".join(stack) + "".join(atoms)
+    if html:
+        closing = "".join(f"</{_tag_name(tag)}>" for tag in reversed(_open_tags_after(atoms, stack)))
+        body += closing
+        return body.strip("\n ") if not stack else body
+    return body.strip()
+
+async def _with_retry(call):
+    """Вызов Telegram API с ожиданием при RetryAfter"""
+    while True:
+        try:
+            return await call()
+        except RetryAfter as e:
+            metrics.inc("telegram_rate_limited_total", help_text="Ответы Telegram RetryAfter")
+            await asyncio.sleep(e.retry_after)
+
+async def send_document(first_message, reply_to, text):
+    """Очень длинный ответ: превью в сообщении и полный текст файлом"""
+    preview = text[:PREVIEW_LENGTH].rsplit(" ", 1)[0]
+    if first_message:
+        await _with_retry(lambda: first_message.edit_text(f"{preview}…\n\n📎 Полный ответ во вложении"))
+    await _with_retry(lambda: reply_to.reply_document(
+        document=io.BytesIO(text.encode("utf-8")), filename="response.txt"
+    ))
+    metrics.inc("responses_as_document_total", help_text="Ответы, отправленные файлом")
+
+async def _send_chunk(send, chunk, parse_mode):
+    """Отправка одной части; если Telegram отклонил HTML-разметку, эта часть
+    уходит текстом - уже доставленные части не повторяются"""
+    try:
+        return await _with_retry(lambda: send(chunk, parse_mode=parse_mode))
+    except BadRequest as e:
+        if parse_mode != ParseMode.HTML or "not modified" in str(e).lower():
+            raise
+        logger.warning(f"Telegram отклонил HTML-разметку, отправляем часть текстом: {e}")
+        return await _with_retry(lambda: send(unescape(TAG_RE.sub("", chunk))))
+
+async def send_chunks(first_message, reply_to, chunks, parse_mode=None):
+    """Отправка частей ответа.
+
+    Правка первого сообщения идет параллельно с отправкой остальных частей,
+    которые уходят строго по порядку. Без first_message все части
+    отправляются ответами на reply_to.
+    """
+    if first_message is None:
+        for chunk in chunks:
+            await _send_chunk(reply_to.reply_text, chunk, parse_mode)
+        return
+
+    async def edit_first():
+        with metrics.timer("edit_text_seconds", "Правка сообщения в Telegram"):
+            await _send_chunk(first_message.edit_text, chunks[0], parse_mode)
+
+    async def send_rest():
+        for chunk in chunks[1:]:
+            await _send_chunk(reply_to.reply_text, chunk, parse_mode)
+
+    await asyncio.gather(edit_first(), send_rest())
+
+async def send_response(first_message, reply_to, text, html=None, limit=MESSAGE_LIMIT,
+                        document_threshold=DOCUMENT_THRESHOLD):
+    """Отправка готового ответа: HTML-разметкой (части с ошибкой разметки -
+    текстом), ответы длиннее document_threshold - файлом"""
+    if document_threshold and visible_len(text) > document_threshold:
+        await send_document(first_message, reply_to, text)
+        return
+    if html:
+        await send_chunks(first_message, reply_to, split_text(html, limit, html=True), ParseMode.HTML)
+        return
+    await send_chunks(first_message, reply_to, split_text(text, limit))
+
+class StreamingReply:
+    """Постепенная доставка ответа через редактирование сообщений Telegram.
+
+    Промежуточные правки отправляются не чаще min_interval секунд; текст,
+    не помещающийся в одно сообщение, переносится в новые сообщения. Ответ
+    длиннее document_threshold в итоге заменяется файлом.
+    """
+
+    def __init__(self, first_message, reply_to, min_interval=1.5, limit=MESSAGE_LIMIT,
+                 document_threshold=DOCUMENT_THRESHOLD):
+        self.messages = [first_message]
+        self.shown = [None]
+        self.reply_to = reply_to
+        self.min_interval = min_interval
+        self.limit = limit
+        self.document_threshold = document_threshold
+        self._last_update = 0.0
+
+    async def update(self, text, final=False):
+        """Показ текущего текста ответа; промежуточные обновления прореживаются"""
+        loop = asyncio.get_running_loop()
+        if not final and loop.time() - self._last_update < self.min_interval:
+            return
+        self._last_update = loop.time()
+
+        chunks = split_text(text, self.limit)
+        for index, chunk in enumerate(chunks):
+            # Курсор показывает, что генерация последней части еще идет
+            if not final and index == len(chunks) - 1:
+                chunk += STREAM_CURSOR
+            await self._show(index, chunk, final)
+
+    async def finish(self, text, html=None):
+        """Финальное обновление: HTML-разметка с разбивкой на части, очень
+        длинный ответ - файлом"""
+        if self.document_threshold and visible_len(text) > self.document_threshold:
+            await self._drop_messages(1)
+            await send_document(self.messages[0], self.reply_to, text)
+            return
+        if html:
+            try:
+                chunks = split_text(html, self.limit, html=True)
+                for index, chunk in enumerate(chunks):
+                    await self._show(index, chunk, True, ParseMode.HTML)
+                await self._drop_messages(len(chunks))
+                return
+            except BadRequest as e:
+                logger.warning(f"Telegram отклонил HTML-разметку, отправляем текстом: {e}")
+        await self.update(text, final=True)
+        await self._drop_messages(len(split_text(text, self.limit)))
+
+    async def discard(self):
+        """Удаление частей, перенесенных в новые сообщения; первое сообщение остается"""
+        try:
+            await self._drop_messages(1)
+        except TelegramError as e:
+            logger.warning(f"Не удалось удалить части ответа: {e}")
+
+    async def _drop_messages(self, keep):
+        """Удаление лишних сообщений, если итоговых частей стало меньше"""
+        while len(self.messages) > keep:
+            message = self.messages.pop()
+            self.shown.pop()
+            try:
+                await _with_retry(message.delete)
+            except BadRequest as e:
+                logger.warning(f"Не удалось удалить сообщение: {e}")
+
+    async def _show(self, index, chunk, final, parse_mode=None):
+        if index < len(self.shown) and self.shown[index] == chunk:
+            return
+        while True:
+            try:
+                if index < len(self.messages):
+                    with metrics.timer("edit_text_seconds", "Правка сообщения в Telegram"):
+                        await self.messages[index].edit_text(chunk, parse_mode=parse_mode)
+                else:
+                    self.messages.append(await self.reply_to.reply_text(chunk, parse_mode=parse_mode))
+                    self.shown.append(None)
+                self.shown[index] = chunk
+                return
+            except RetryAfter as e:
+                metrics.inc("telegram_rate_limited_total", help_text="Ответы Telegram RetryAfter")
+                # Промежуточные правки можно пропустить, финальную - нельзя
+                if not final:
+                    logger.info(f"Telegram ограничил частоту правок, пропускаем обновления {e.retry_after} с")
+                    self._last_update = asyncio.get_running_loop().time() + e.retry_after
+                    return
+                await asyncio.sleep(e.retry_after)
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    self.shown[index] = chunk
+                    return
+                raise
@@ -0,0 +1,43 @@
+import pytest
+from account_router import AccountRouter, AccountShard
+from session_pool import SessionPoolError
+
+class FakePool:
+    def __init__(self, readiness="ready"):
+        self.readiness = readiness
+
+def make_router(count=3):
+    shards = [AccountShard(f"account{i}", FakePool()) for i in range(count)]
+    return AccountRouter(shards, cooldown=60), shards
+
+def test_user_sticks_to_account():
+    router, _ = make_router()
+    assert all(router.route(user_id) is router.route(user_id) for user_id in range(100))
+    assert len({router.route(user_id).account_id for user_id in range(100)}) == 3
+
+def test_cooldown_moves_users_and_returns_them():
+    router, _ = make_router()
+    home = {user_id: router.route(user_id) for user_id in range(100)}
+    cooled = home[0]
+    router.cool_down(cooled)
+    assert router.cooling == 1
+    for user_id, shard in home.items():
+        routed = router.route(user_id)
+        # Переезжают только пользователи аккаунта на паузе
+        assert routed is not cooled
+        if shard is not cooled:
+            assert routed is shard
+    router.cool_down(cooled, 0)
+    assert all(router.route(user_id) is shard for user_id, shard in home.items())
+
+def test_unavailable_pool_is_skipped():
+    router, shards = make_router(2)
+    shards[0].pool.readiness = "unavailable"
+    assert all(router.route(user_id) is shards[1] for user_id in range(20))
+
+def test_no_accounts_available():
+    router, shards = make_router(2)
+    for shard in shards:
+        router.cool_down(shard)
+    with pytest.raises(SessionPoolError):
+        router.route(1)
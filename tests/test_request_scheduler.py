@@ -0,0 +1,97 @@
+import asyncio
+import pytest
+from request_scheduler import ChatRequest, QueueFullError, RequestScheduler
+
+def make_request(user_id, prompt):
+    return ChatRequest(user_id=user_id, chat_id=user_id, prompt=prompt, processing_message=None, reply_to=None)
+
+def test_users_are_served_round_robin():
+    async def scenario():
+        handled = []
+        done = asyncio.Event()
+
+        async def handler(request):
+            handled.append(request.prompt)
+            if len(handled) == 5:
+                done.set()
+
+        scheduler = RequestScheduler(handler)
+        for user_id, prompt in [(1, "a1"), (1, "a2"), (1, "a3"), (2, "b1"), (3, "c1")]:
+            await scheduler.submit(make_request(user_id, prompt))
+        scheduler.start()
+        await asyncio.wait_for(done.wait(), 1)
+        await scheduler.stop()
+        return handled
+    assert asyncio.run(scenario()) == ["a1", "b1", "c1", "a2", "a3"]
+
+def test_positions_follow_round_robin_order():
+    async def scenario():
+        async def on_position_change(request):
+            pass
+
+        scheduler = RequestScheduler(None, on_position_change=on_position_change)
+        positions = {}
+        for user_id, prompt in [(1, "a1"), (1, "a2"), (1, "a3"), (2, "b1")]:
+            positions[prompt] = await scheduler.submit(make_request(user_id, prompt))
+        current = {request.prompt: request.position for queue in scheduler._queues.values() for request in queue}
+        return positions, current
+    positions, current = asyncio.run(scenario())
+    assert positions == {"a1": 1, "a2": 2, "a3": 3, "b1": 2}
+    # Новый пользователь встает в круг и сдвигает второй и третий запросы первого
+    assert current == {"a1": 1, "a2": 3, "a3": 4, "b1": 2}
+
+def test_position_changes_are_reported():
+    async def scenario():
+        changed = []
+
+        async def on_position_change(request):
+            changed.append((request.prompt, request.position))
+
+        scheduler = RequestScheduler(None, on_position_change=on_position_change)
+        await scheduler.submit(make_request(1, "a1"))
+        await scheduler.submit(make_request(1, "a2"))
+        await scheduler.submit(make_request(2, "b1"))
+        await asyncio.sleep(0)
+        return changed
+    assert asyncio.run(scenario()) == [("a2", 3)]
+
+def test_one_request_per_user_at_a_time():
+    async def scenario():
+        running = set()
+        overlaps = []
+        done = asyncio.Event()
+        handled = []
+
+        async def handler(request):
+            if request.user_id in running:
+                overlaps.append(request.prompt)
+            running.add(request.user_id)
+            await asyncio.sleep(0.01)
+            running.discard(request.user_id)
+            handled.append(request.prompt)
+            if len(handled) == 3:
+                done.set()
+
+        scheduler = RequestScheduler(handler, workers=3)
+        for prompt in ("a1", "a2", "a3"):
+            await scheduler.submit(make_request(1, prompt))
+        scheduler.start()
+        await asyncio.wait_for(done.wait(), 1)
+        await scheduler.stop()
+        return handled, overlaps
+    handled, overlaps = asyncio.run(scenario())
+    assert handled == ["a1", "a2", "a3"]
+    assert overlaps == []
+
+def test_queue_limits():
+    async def scenario():
+        scheduler = RequestScheduler(None, max_queue_size=3, max_per_user=2)
+        await scheduler.submit(make_request(1, "a1"))
+        await scheduler.submit(make_request(1, "a2"))
+        with pytest.raises(QueueFullError):
+            await scheduler.submit(make_request(1, "a3"))
+        await scheduler.submit(make_request(2, "b1"))
+        with pytest.raises(QueueFullError):
+            await scheduler.submit(make_request(3, "c1"))
+        return scheduler.size
+    assert asyncio.run(scenario()) == 3
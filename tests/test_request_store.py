@@ -0,0 +1,33 @@
+from request_store import RequestStore
+
+def test_unacknowledged_requests_survive_restart(tmp_path):
+    path = str(tmp_path / "requests.sqlite3")
+    store = RequestStore(path)
+    first = store.add(1, 10, "private", 100, 101, "первый")
+    second = store.add(2, 20, "group", 200, 201, "второй")
+    third = store.add(1, 10, "private", 102, 103, "третий")
+    store.start(first)
+    store.start(second)
+    store.ack(second)
+    store.close()
+
+    # После перезапуска бота остаются недоставленные запросы в порядке поступления
+    store = RequestStore(path)
+    rows = store.unfinished()
+    assert [row["id"] for row in rows] == [first, third]
+    assert rows[0]["prompt"] == "первый"
+    assert rows[0]["state"] == "in_progress"
+    assert rows[0]["attempts"] == 1
+    assert (rows[1]["state"], rows[1]["attempts"]) == ("pending", 0)
+    assert (rows[1]["chat_id"], rows[1]["chat_type"], rows[1]["processing_message_id"]) == (10, "private", 103)
+    store.close()
+
+def test_attempts_count_each_start(tmp_path):
+    store = RequestStore(str(tmp_path / "requests.sqlite3"))
+    request_id = store.add(1, 10, "private", 100, 101, "запрос")
+    for _ in range(3):
+        store.start(request_id)
+    assert store.unfinished()[0]["attempts"] == 3
+    store.ack(request_id)
+    assert store.unfinished() == []
+    store.close()
@@ -0,0 +1,41 @@
+import time
+from response_cache import ResponseCache
+
+def test_normalized_prompts_share_entry(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("Что такое Python?", "Язык программирования")
+    assert cache.get("  что   такое python") == "Язык программирования"
+    assert cache.get("Что такое Rust?") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+def test_expired_entry_is_removed(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), ttl=60)
+    cache.put("вопрос", "ответ")
+    cache.conn.execute("UPDATE responses SET created_at = ?", (time.time() - 120,))
+    assert cache.get("вопрос") is None
+    assert cache.stats()["entries"] == 0
+    cache.close()
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    response = "я" * 50
+    size = len(response.encode("utf-8"))
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=size * 2)
+    cache.put("первый", response)
+    time.sleep(0.01)
+    cache.put("второй", response)
+    time.sleep(0.01)
+    assert cache.get("первый") == response
+    time.sleep(0.01)
+    cache.put("третий", response)
+    assert cache.get("второй") is None
+    assert cache.get("первый") == response
+    assert cache.get("третий") == response
+    assert cache.stats()["bytes"] == size * 2
+    cache.close()
+
+def test_oversized_response_is_not_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=10)
+    cache.put("вопрос", "длинный ответ")
+    assert cache.get("вопрос") is None
+    cache.close()
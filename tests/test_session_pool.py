@@ -0,0 +1,92 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+from session_pool import SessionPool
+
+class FakeClient:
+    """Клиент без браузера: проверка здоровья задается флагом broken"""
+
+    def __init__(self, index, broken=False):
+        self.index = index
+        self.broken = broken
+        self.closed = False
+
+    async def setup_driver(self):
+        pass
+
+    async def login(self):
+        return True
+
+    async def check_health(self):
+        if self.broken:
+            raise BrokenProcessPool("рабочий процесс завершился")
+        return True
+
+    async def probe_health(self):
+        if self.broken:
+            raise BrokenProcessPool("рабочий процесс завершился")
+        return {"healthy": True, "logged_in": True, "heap_mb": None, "session_expires_in": None}
+
+    async def close(self):
+        self.closed = True
+
+def make_pool(clients, **kwargs):
+    def factory(index):
+        client = FakeClient(index)
+        clients.append(client)
+        return client
+    return SessionPool(factory, health_check_interval=0, acquire_timeout=1, **kwargs)
+
+async def wait_ready(pool, count):
+    while sum(state == "idle" for state in pool.states.values()) < count:
+        await asyncio.sleep(0)
+
+def test_failing_health_check_recycles_slot():
+    async def scenario():
+        clients = []
+        pool = make_pool(clients)
+        pool.start()
+        await wait_ready(pool, 1)
+        clients[0].broken = True
+        async with pool.session() as client:
+            # Слот не потерян: сессия перезапущена и выдана снова
+            assert client is clients[1]
+        assert clients[0].closed
+        assert pool.states == {0: "idle"}
+        async with pool.session() as client:
+            assert client is clients[1]
+        await pool.close()
+    asyncio.run(scenario())
+
+def test_monitor_recycles_session_with_failing_probe():
+    async def scenario():
+        clients = []
+        pool = make_pool(clients)
+        pool.start()
+        await wait_ready(pool, 1)
+        clients[0].broken = True
+        pool._idle.get_nowait()
+        pool.states[0] = "checking"
+        await pool._check(0)
+        assert pool.states[0] == "broken"
+        async with pool.session() as client:
+            assert client is clients[1]
+        await pool.close()
+    asyncio.run(scenario())
+
+def test_error_inside_session_keeps_healthy_slot():
+    async def scenario():
+        clients = []
+        pool = make_pool(clients)
+        pool.start()
+        await wait_ready(pool, 1)
+        try:
+            async with pool.session():
+                raise ValueError("ошибка запроса")
+        except ValueError:
+            pass
+        await wait_ready(pool, 1)
+        async with pool.session() as client:
+            assert client is clients[0]
+        assert len(clients) == 1
+        await pool.close()
+    asyncio.run(scenario())
@@ -0,0 +1,32 @@
+import asyncio
+from single_flight import SingleFlight
+
+def test_followers_get_leader_result():
+    async def scenario():
+        flights = SingleFlight()
+        assert flights.lead("key")
+        assert not flights.lead("key")
+        waiters = [asyncio.create_task(flights.wait("key")) for _ in range(2)]
+        await asyncio.sleep(0)
+        flights.finish("key", ("ответ", "<b>ответ</b>"))
+        results = await asyncio.gather(*waiters)
+        return flights, results
+    flights, results = asyncio.run(scenario())
+    assert results == [("ответ", "<b>ответ</b>")] * 2
+    assert flights.saved == 2
+    assert len(flights) == 0
+
+def test_failed_leader_saves_nothing():
+    async def scenario():
+        flights = SingleFlight()
+        flights.lead("key")
+        waiter = asyncio.create_task(flights.wait("key"))
+        await asyncio.sleep(0)
+        flights.finish("key")
+        result = await waiter
+        # После завершения следующий такой же запрос снова становится ведущим
+        return flights, result, flights.lead("key")
+    flights, result, leads = asyncio.run(scenario())
+    assert result is None
+    assert flights.saved == 0
+    assert leads
@@ -0,0 +1,102 @@
+import asyncio
+import re
+import pytest
+
+pytest.importorskip("telegram")
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest
+from telegram_utils import send_chunks, split_text, visible_len, utf16_len
+
+TAG_NAME_RE = re.compile(r"</?(\w+)")
+
+def assert_balanced(chunk):
+    """Теги части закрыты в обратном порядке"""
+    stack = []
+    for tag in re.findall(r"<[^>]+>", chunk):
+        name = TAG_NAME_RE.match(tag).group(1)
+        if tag.startswith("</"):
+            assert stack and stack.pop() == name, chunk
+        else:
+            stack.append(name)
+    assert not stack, chunk
+
+def test_short_text_is_single_chunk():
+    assert split_text("Привет, мир") == ["Привет, мир"]
+
+def test_empty_text():
+    assert split_text("") == [""]
+
+def test_chunks_fit_limit_in_utf16():
+    text = " ".join(["😀слово"] * 500)
+    chunks = split_text(text, limit=100)
+    assert all(utf16_len(chunk) <= 100 for chunk in chunks)
+    assert " ".join(chunks) == text
+
+def test_prefers_paragraph_break():
+    first = "а" * 60
+    second = "б" * 60
+    assert split_text(f"{first}\n\n{second}", limit=100) == [first, second]
+
+def test_long_word_is_cut():
+    chunks = split_text("x" * 250, limit=100)
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+
+def test_html_tags_reopened_in_next_chunk():
+    html = "<pre>" + "\n".join(f"line {i}" for i in range(100)) + "</pre>"
+    chunks = split_text(html, limit=100, html=True)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.startswith("<pre>") and chunk.endswith("</pre>")
+        assert visible_len(chunk, html=True) <= 100
+        assert_balanced(chunk)
+
+@pytest.mark.parametrize("html", [
+    "intro\n\n<pre>" + "z" * 9000 + "</pre>",
+    "intro<pre>" + "z" * 9000 + "</pre>",
+    "<b>" + "y" * 9000 + "</b>",
+    "<b><i>" + "y" * 9000 + "</i></b>",
+], ids=["pre-after-paragraph", "pre-after-word", "bold", "nested"])
+def test_long_word_in_tag_has_no_empty_chunks(html):
+    chunks = split_text(html, html=True)
+    for chunk in chunks:
+        assert visible_len(chunk, html=True) <= 4000
+        assert re.sub(r"<[^>]+>", "", chunk).strip(), chunk
+        assert_balanced(chunk)
+    text = "".join(re.sub(r"<[^>]+>", "", chunk) for chunk in chunks)
+    assert text == re.sub(r"<[^>]+>|\s", "", html)
+
+def test_entities_are_not_cut():
+    html = "<code>" + "a&amp;" * 300 + "</code>"
+    chunks = split_text(html, limit=101, html=True)
+    for chunk in chunks:
+        body = re.sub(r"<[^>]+>", "", chunk)
+        assert not re.search(r"&(?!amp;)|&a?m?p?$", body), chunk
+        assert visible_len(chunk, html=True) <= 101
+
+class FakeMessage:
+    """Сообщение Telegram, записывающее отправленный текст"""
+
+    def __init__(self, log, reject_html=()):
+        self.log = log
+        self.reject_html = reject_html
+
+    async def _deliver(self, kind, text, parse_mode):
+        if parse_mode and any(marker in text for marker in self.reject_html):
+            raise BadRequest("Can't parse entities")
+        self.log.append((kind, text, parse_mode))
+        return FakeMessage(self.log, self.reject_html)
+
+    async def edit_text(self, text, parse_mode=None):
+        return await self._deliver("edit", text, parse_mode)
+
+    async def reply_text(self, text, parse_mode=None):
+        return await self._deliver("reply", text, parse_mode)
+
+def test_rejected_html_chunk_is_resent_alone_as_text():
+    log = []
+    message = FakeMessage(log, reject_html=("<broken>",))
+    chunks = ["<b>one</b>", "<broken>two</broken>", "<i>three</i>"]
+    asyncio.run(send_chunks(message, message, chunks, ParseMode.HTML))
+    assert sorted(text for _, text, _ in log) == ["<b>one</b>", "<i>three</i>", "two"]
+    assert [text for kind, text, _ in log if kind == "reply"] == ["two", "<i>three</i>"]
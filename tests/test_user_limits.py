@@ -0,0 +1,39 @@
+import pytest
+from user_limits import LimitExceededError, UserLimits
+
+def test_messages_per_minute():
+    limits = UserLimits(user_messages_per_minute=2)
+    limits.check(1, 1, 10)
+    limits.check(1, 1, 10)
+    with pytest.raises(LimitExceededError):
+        limits.check(1, 1, 10)
+    # У другого пользователя своя корзина
+    limits.check(2, 1, 10)
+
+def test_bucket_refills_over_time():
+    limits = UserLimits(user_messages_per_minute=1)
+    limits.check(1, 1, 10)
+    with pytest.raises(LimitExceededError):
+        limits.check(1, 1, 10)
+    bucket = limits._buckets[("user_messages", 1)]
+    bucket.updated -= 120
+    limits.check(1, 1, 10)
+
+def test_rejected_request_spends_nothing():
+    limits = UserLimits(user_messages_per_minute=5, chat_messages_per_minute=1)
+    limits.check(1, 100, 10)
+    with pytest.raises(LimitExceededError, match="в этом чате"):
+        limits.check(1, 100, 10)
+    assert limits._buckets[("user_messages", 1)].tokens == pytest.approx(4, abs=0.01)
+
+def test_too_long_prompt():
+    limits = UserLimits(user_chars_per_hour=100)
+    with pytest.raises(LimitExceededError, match="слишком длинный"):
+        limits.check(1, 1, 101)
+    limits.check(1, 1, 100)
+
+def test_zero_limits_disable_checks():
+    limits = UserLimits()
+    for _ in range(100):
+        limits.check(1, 1, 10000)
+    assert limits._buckets == {}
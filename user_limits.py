@@ -0,0 +1,117 @@
+import time
+from metrics import metrics
+
+class LimitExceededError(Exception):
+    """Пользователь или чат превысил лимит запросов"""
+
+class TokenBucket:
+    """Корзина токенов: до capacity токенов, пополняется со скоростью rate в секунду"""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        # now мог быть взят до создания корзины: отрицательное пополнение отняло бы токены
+        if now <= self.updated:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Сколько секунд ждать, пока наберется amount токенов (0 - уже есть)"""
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    @property
+    def full(self):
+        return self.tokens >= self.capacity
+
+class UserLimits:
+    """Лимиты пользователей и чатов: сообщения в минуту и символы запросов в час.
+
+    Проверяются до постановки запроса в очередь, поэтому один активный
+    пользователь не занимает браузер в ущерб остальным. Нулевой лимит
+    отключает соответствующую проверку.
+    """
+
+    def __init__(self, user_messages_per_minute=0, user_chars_per_hour=0,
+                 chat_messages_per_minute=0, chat_chars_per_hour=0, max_buckets=10000):
+        self.limits = {
+            "user_messages": (user_messages_per_minute, 60),
+            "user_chars": (user_chars_per_hour, 3600),
+            "chat_messages": (chat_messages_per_minute, 60),
+            "chat_chars": (chat_chars_per_hour, 3600),
+        }
+        self.max_buckets = max_buckets
+        self._buckets = {}
+
+    def _bucket(self, kind, key):
+        capacity, period = self.limits[kind]
+        bucket = self._buckets.get((kind, key))
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._prune()
+            bucket = self._buckets[(kind, key)] = TokenBucket(capacity, capacity / period)
+        return bucket
+
+    def _prune(self):
+        """Удаление полных корзин: их владельцы давно ничего не отправляли"""
+        now = time.monotonic()
+        for key, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.full:
+                del self._buckets[key]
+
+    def check(self, user_id, chat_id, chars):
+        """Списание сообщения и символов запроса; LimitExceededError, если лимит исчерпан.
+
+        Токены списываются только если проходят все проверки.
+        """
+        now = time.monotonic()
+        demands = (("user_messages", user_id, 1), ("user_chars", user_id, chars),
+                   ("chat_messages", chat_id, 1), ("chat_chars", chat_id, chars))
+        buckets = []
+        for kind, key, amount in demands:
+            if not self.limits[kind][0]:
+                continue
+            if kind.endswith("_chars") and amount > self.limits[kind][0]:
+                raise LimitExceededError(f"Запрос слишком длинный: не больше {self.limits[kind][0]} символов")
+            bucket = self._bucket(kind, key)
+            bucket.refill(now)
+            wait = bucket.wait_time(amount)
+            if wait:
+                metrics.inc("rate_limited_total", help_text="Запросы, отклоненные лимитами пользователей и чатов")
+                scope = "в этом чате" if kind.startswith("chat") else "у вас"
+                raise LimitExceededError(f"Слишком много запросов {scope}, попробуйте через {int(wait) + 1} с")
+            buckets.append((bucket, amount))
+        for bucket, amount in buckets:
+            bucket.tokens -= amount
+
+class UsageStats:
+    """Потребление по пользователям с момента запуска бота"""
+
+    def __init__(self):
+        self.users = {}
+
+    def _user(self, user_id):
+        return self.users.setdefault(
+            user_id, {"messages": 0, "prompt_chars": 0, "response_chars": 0, "browser_seconds": 0.0}
+        )
+
+    def record_request(self, user_id, prompt):
+        usage = self._user(user_id)
+        usage["messages"] += 1
+        usage["prompt_chars"] += len(prompt)
+
+    def record_response(self, user_id, response):
+        self._user(user_id)["response_chars"] += len(response)
+
+    def record_browser_time(self, user_id, seconds):
+        self._user(user_id)["browser_seconds"] += seconds
+        metrics.inc("browser_seconds_total", seconds, "Время работы браузеров над запросами (сек)")
+
+    def top(self, limit=20):
+        """Пользователи с наибольшим временем браузера"""
+        return sorted(self.users.items(), key=lambda item: item[1]["browser_seconds"], reverse=True)[:limit]